@@ -0,0 +1,70 @@
+import hashlib
+import secrets
+from datetime import datetime
+from functools import wraps
+
+from flask import request, jsonify, g
+
+from app import db
+from models import ApiKey
+
+API_KEY_PREFIX = 'ct_'
+
+
+def hash_api_key(raw_key):
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+def create_api_key(company_id, name):
+    """
+    Store a new key for `company_id` and return (ApiKey, raw key).
+    The raw key is only available here; the database keeps its hash.
+    """
+    raw_key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+    api_key = ApiKey(company_id=company_id, name=name, key_hash=hash_api_key(raw_key))
+    db.session.add(api_key)
+    db.session.commit()
+    return api_key, raw_key
+
+
+def revoke_api_key(key_id):
+    api_key = db.session.get(ApiKey, key_id)
+    if api_key is None or api_key.revoked_at is not None:
+        return False
+    api_key.revoked_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def company_id_for_key(raw_key):
+    if not raw_key:
+        return None
+    return db.session.query(ApiKey.company_id).filter(
+        ApiKey.key_hash == hash_api_key(raw_key),
+        ApiKey.revoked_at.is_(None)
+    ).scalar()
+
+
+def _key_from_request():
+    auth = request.headers.get('Authorization', '')
+    if auth[:7].lower() == 'bearer ':
+        return auth[7:].strip()
+    return request.headers.get('X-API-Key', '').strip()
+
+
+def api_key_required(view):
+    """
+    Authenticate a JSON API call by API key (`Authorization: Bearer <key>`
+    or `X-API-Key`) and expose the owning company as `g.api_company_id`.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        company_id = company_id_for_key(_key_from_request())
+        if company_id is None:
+            response = jsonify({'error': 'A valid API key is required.'})
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        g.api_company_id = company_id
+        return view(*args, **kwargs)
+    return wrapped
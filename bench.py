@@ -0,0 +1,213 @@
+import csv
+import io
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, insert, delete
+
+from app import db
+from models import Company, Activity, ActivityRollup, EmissionTarget, CompanyDataVersion, to_kg
+from rollups import rebuild_rollups
+from date_buckets import date_bucket
+
+CATEGORIES = ['energy', 'transportation', 'manufacturing', 'business_travel', 'waste', 'water', 'other']
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', counter)
+
+
+def synthetic_activity_rows(count, months=24, seed=42):
+    """
+    Yields `count` random activity dicts spread over the last `months` months.
+    """
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=months * 30)
+    for i in range(count):
+        value = round(rng.uniform(1, 5000), 2)
+        yield {
+            'title': f"Activity {i}",
+            'category': rng.choice(CATEGORIES),
+            'description': '',
+            'date': start + timedelta(days=rng.randrange(months * 30)),
+            'emission_value': value,
+            'emission_unit': 'tonnes' if rng.random() < 0.1 else 'kg',
+        }
+
+
+def synthetic_activity_csv(count, months=24, seed=42):
+    """
+    The same rows as synthetic_activity_rows, encoded as an import CSV.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['title', 'category', 'description', 'date',
+                                                'emission_value', 'emission_unit'])
+    writer.writeheader()
+    writer.writerows(synthetic_activity_rows(count, months, seed))
+    return buffer.getvalue().encode('utf-8')
+
+
+@contextmanager
+def bench_company(activities, months=24, seed=42):
+    """
+    A throwaway company with `activities` synthetic rows, removed afterwards.
+    """
+    company = Company(name='Benchmark Co', email=f"bench-{time.time_ns()}@example.invalid",
+                      industry='other', size='large')
+    company.set_password(str(time.time_ns()))
+    db.session.add(company)
+    db.session.commit()
+
+    batch = []
+    for record in synthetic_activity_rows(activities, months, seed):
+        record['emission_kg'] = to_kg(record['emission_value'], record['emission_unit'])
+        record['company_id'] = company.id
+        batch.append(record)
+        if len(batch) == 5000:
+            db.session.execute(insert(Activity), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Activity), batch)
+    db.session.commit()
+    rebuild_rollups(company.id)
+    # Detached with its attributes loaded, so benchmark threads reading
+    # company.id never refresh it through this thread's session
+    db.session.refresh(company)
+    db.session.expunge(company)
+
+    try:
+        yield company
+    finally:
+        db.session.rollback()
+        for model in (Activity, ActivityRollup, EmissionTarget, CompanyDataVersion):
+            db.session.execute(delete(model).where(model.company_id == company.id))
+        db.session.execute(delete(Company).where(Company.id == company.id))
+        db.session.commit()
+
+
+def legacy_emission_stats(company_id, from_date=None, to_date=None):
+    """
+    The original get_emission_stats: four queries over raw activity rows
+    (SQLite only, because of strftime).
+    """
+    query = Activity.query.filter_by(company_id=company_id)
+    if from_date:
+        query = query.filter(Activity.date >= from_date)
+    if to_date:
+        query = query.filter(Activity.date <= to_date)
+
+    total_emissions = query.with_entities(func.sum(Activity.emission_kg)).scalar() or 0
+    by_category = query.with_entities(
+        Activity.category,
+        func.sum(Activity.emission_kg).label('total')
+    ).group_by(Activity.category).all()
+    monthly_trend = query.with_entities(
+        func.strftime('%Y-%m', Activity.date).label('month'),
+        func.sum(Activity.emission_kg).label('total')
+    ).group_by('month').order_by('month').all()
+    highest_emissions = query.order_by(Activity.emission_kg.desc()).limit(5).all()
+
+    return {
+        'total_emissions': total_emissions,
+        'by_category': by_category,
+        'monthly_trend': monthly_trend,
+        'highest_emissions': highest_emissions
+    }
+
+
+def rollup_check_ranges(today=None):
+    """
+    (label, from_date, to_date) ranges that exercise every way rollup_source
+    splits a range into whole and partial months.
+    """
+    today = today or date.today()
+    this_month = today.replace(day=1)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    two_back = (last_month - timedelta(days=1)).replace(day=1)
+    return [
+        ('all time', None, None),
+        ('open start', None, last_month + timedelta(days=9)),
+        ('open end', two_back + timedelta(days=9), None),
+        ('within one month', last_month + timedelta(days=4), last_month + timedelta(days=19)),
+        ('one whole month', last_month, this_month - timedelta(days=1)),
+        ('across a month boundary', two_back + timedelta(days=4), last_month + timedelta(days=24)),
+        ('last day to first day', last_month - timedelta(days=1), last_month),
+        ('partial, whole, partial', two_back + timedelta(days=9), this_month + timedelta(days=2)),
+        ('empty', last_month + timedelta(days=9), last_month),
+    ]
+
+
+def raw_monthly_trend(company_id, from_date=None, to_date=None):
+    """
+    monthly_trend aggregated straight from activities, as the reference
+    for compute_emission_stats.
+    """
+    month = date_bucket(Activity.date, 'month')
+    query = db.session.query(month, func.sum(Activity.emission_kg))\
+        .filter(Activity.company_id == company_id)
+    if from_date:
+        query = query.filter(Activity.date >= from_date)
+    if to_date:
+        query = query.filter(Activity.date <= to_date)
+    return [(start.strftime('%Y-%m'), total or 0) for start, total in query.group_by(month).order_by(month)]
+
+
+def measure(fn, runs):
+    """
+    Returns (queries per call, mean seconds per call).
+    """
+    fn()  # warm up caches and compiled statements
+    db.session.expunge_all()
+
+    with count_queries() as counter:
+        started = time.perf_counter()
+        for _ in range(runs):
+            fn()
+            db.session.expunge_all()
+        elapsed = time.perf_counter() - started
+    return counter.count / runs, elapsed / runs
+
+
+def run_concurrently(app, fn, threads, calls):
+    """
+    Call fn(thread_index, call_index) `calls` times from each of `threads`
+    threads (each with its own app context). Returns (seconds, errors).
+    """
+    errors = []
+    start = threading.Barrier(threads + 1)
+
+    def worker(index):
+        with app.app_context():
+            start.wait()
+            for call in range(calls):
+                try:
+                    fn(index, call)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, errors
@@ -0,0 +1,89 @@
+from sqlalchemy import select, delete, update, func, exists
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from models import Activity, IdempotencyKey
+from rollups import RollupDeltas, apply_rollup_deltas
+from data_version import bump_data_versions
+
+
+class BulkActionConflict(Exception):
+    """
+    The bulk change collided with concurrent writes (lock timeout, deadlock
+    or serialization failure) and was rolled back; it can be retried.
+    """
+
+
+def count_matching_activities(clauses):
+    return db.session.scalar(select(func.count(Activity.id)).where(*clauses)) or 0
+
+
+def _commit_bulk_change(company_id, deltas, changed):
+    apply_rollup_deltas(db.session.connection(), deltas)
+    if changed:
+        bump_data_versions(db.session.connection(), [company_id])
+    db.session.commit()
+
+
+def bulk_delete_activities(company_id, clauses):
+    """
+    Delete every activity matching `clauses` (which must include the
+    company_id clause) with one DELETE, and take them out of the rollups.
+    Returns the number of activities deleted.
+    """
+    try:
+        # The rollup deltas come from exactly the rows the DELETE removed,
+        # so rows written concurrently can never be miscounted
+        deleted = db.session.execute(
+            delete(Activity).where(*clauses)
+            .returning(Activity.date, Activity.category, Activity.emission_kg)
+            .execution_options(synchronize_session=False)
+        ).all()
+        deltas = RollupDeltas()
+        for day, category, emission_kg in deleted:
+            deltas.add(company_id, day, category, -(emission_kg or 0), -1)
+
+        if deleted:
+            # Forget their idempotency keys so a corrected re-import is not
+            # treated as a retry (PostgreSQL's ON DELETE CASCADE already has)
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.company_id == company_id,
+                       ~exists().where(Activity.id == IdempotencyKey.activity_id))
+                .execution_options(synchronize_session=False)
+            )
+        _commit_bulk_change(company_id, deltas, len(deleted))
+    except OperationalError as e:
+        db.session.rollback()
+        raise BulkActionConflict(str(e)) from e
+    return len(deleted)
+
+
+def bulk_recategorize_activities(company_id, clauses, category):
+    """
+    Move every activity matching `clauses` to `category` and shift their
+    totals between rollup buckets, with one UPDATE per current category.
+    Returns the number changed.
+    """
+    clauses = list(clauses) + [Activity.category != category]
+    changed = 0
+    try:
+        old_categories = db.session.scalars(select(Activity.category).where(*clauses).distinct()).all()
+        deltas = RollupDeltas()
+        for old_category in old_categories:
+            # RETURNING only sees the new row, so each UPDATE covers one old category
+            moved = db.session.execute(
+                update(Activity).where(*clauses, Activity.category == old_category)
+                .values(category=category)
+                .returning(Activity.date, Activity.emission_kg)
+                .execution_options(synchronize_session=False)
+            ).all()
+            for day, emission_kg in moved:
+                deltas.add(company_id, day, old_category, -(emission_kg or 0), -1)
+                deltas.add(company_id, day, category, emission_kg or 0)
+            changed += len(moved)
+        _commit_bulk_change(company_id, deltas, changed)
+    except OperationalError as e:
+        db.session.rollback()
+        raise BulkActionConflict(str(e)) from e
+    return changed
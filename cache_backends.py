@@ -0,0 +1,517 @@
+import hashlib
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+MISSING = object()
+
+STAT_NAMES = ('hits', 'misses', 'sets', 'evictions', 'errors')
+
+
+class NamespaceStats:
+    """
+    Hit/miss/set/eviction/error counters per cache namespace (per process).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, namespace, name, count=1):
+        with self._lock:
+            stats = self._stats.setdefault(namespace, dict.fromkeys(STAT_NAMES, 0))
+            stats[name] += count
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for namespace, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses']
+                result[namespace] = dict(stats, hit_rate=round(stats['hits'] / lookups, 3) if lookups else None)
+            return result
+
+
+def _dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+class CacheBackend:
+    """
+    Values are plain Python data, stored under (namespace, key) where key is
+    any value with a stable repr (tuples of str/int/date/None). Backend
+    failures are counted and behave as misses; a cache must never take a
+    request down.
+    """
+    name = 'base'
+    # True when all workers on a host (or all nodes) see the same entries
+    shared = False
+
+    def __init__(self):
+        self.stats = NamespaceStats()
+
+    def get(self, namespace, key):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def info(self):
+        return {}
+
+    def metrics(self):
+        return dict(self.info(), backend=self.name, shared=self.shared, namespaces=self.stats.snapshot())
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU bounded by entry count and by the pickled size of the values.
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (namespace, key) -> (value, size, expires_at)
+        self._bytes = 0
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                self._remove((namespace, key))
+                entry = None
+            if entry is None:
+                self.stats.add(namespace, 'misses')
+                return MISSING
+            self._entries.move_to_end((namespace, key))
+        self.stats.add(namespace, 'hits')
+        return entry[0]
+
+    def set(self, namespace, key, value, ttl=None):
+        size = len(_dumps(value))
+        expires_at = time.time() + ttl if ttl else None
+        evicted = []
+        with self._lock:
+            self._remove((namespace, key))
+            if size > self.max_bytes:
+                self.stats.add(namespace, 'errors')
+                return
+            self._entries[(namespace, key)] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                (evicted_namespace, _), (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted.append(evicted_namespace)
+        self.stats.add(namespace, 'sets')
+        for evicted_namespace in evicted:
+            self.stats.add(evicted_namespace, 'evictions')
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._remove((namespace, key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+    def _remove(self, full_key):
+        entry = self._entries.pop(full_key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+def _storage_key(prefix, namespace, key):
+    # Fixed-length keys whatever the parameters look like
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return f"{prefix}{namespace}:{digest}"
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Cache shared by every worker process on a host through one SQLite file
+    (WAL mode, so readers never block each other). Least recently used
+    entries are evicted once the file holds more than `max_entries` entries
+    or `max_bytes` of values.
+    """
+    name = 'sqlite'
+    shared = True
+
+    # Check the size limits once every this many sets
+    EVICT_EVERY = 32
+    # Don't rewrite accessed_at on every hit
+    TOUCH_INTERVAL = 1.0
+
+    def __init__(self, path, max_entries=10000, max_bytes=128 * 1024 * 1024, key_prefix='', timeout=2.0):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value BLOB NOT NULL,'
+            ' size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key):
+        storage_key = _storage_key(self.key_prefix, namespace, key)
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?', (storage_key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (storage_key,))
+                row = None
+            if row is None:
+                self.stats.add(namespace, 'misses')
+                return MISSING
+            if now - row[2] > self.TOUCH_INTERVAL:
+                conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, storage_key))
+            value = pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError) as e:
+            self._error(namespace, e)
+            return MISSING
+        self.stats.add(namespace, 'hits')
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        data = _dumps(value)
+        if len(data) > self.max_bytes:
+            self.stats.add(namespace, 'errors')
+            return
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, namespace, value, size, expires_at, accessed_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (_storage_key(self.key_prefix, namespace, key), namespace, data, len(data),
+                 now + ttl if ttl else None, now)
+            )
+            self.stats.add(namespace, 'sets')
+            self._sets += 1
+            if self._sets % self.EVICT_EVERY == 0:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            self._error(namespace, e)
+
+    def delete(self, namespace, key):
+        try:
+            self._connection().execute(
+                'DELETE FROM cache_entries WHERE key = ?', (_storage_key(self.key_prefix, namespace, key),)
+            )
+        except sqlite3.Error as e:
+            self._error(namespace, e)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
+
+    def info(self):
+        try:
+            entries, size = self._connection().execute(
+                'SELECT count(*), coalesce(sum(size), 0) FROM cache_entries'
+            ).fetchone()
+        except sqlite3.Error:
+            entries = size = None
+        return {'path': self.path, 'entries': entries, 'bytes': size,
+                'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+    def _evict(self, conn):
+        conn.execute('DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        entries, size = conn.execute('SELECT count(*), coalesce(sum(size), 0) FROM cache_entries').fetchone()
+        excess_entries = entries - self.max_entries
+        excess_bytes = size - self.max_bytes
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+
+        victims = []
+        for key, namespace, entry_size in conn.execute(
+                'SELECT key, namespace, size FROM cache_entries ORDER BY accessed_at'):
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            victims.append((key, namespace))
+            excess_entries -= 1
+            excess_bytes -= entry_size
+
+        conn.executemany('DELETE FROM cache_entries WHERE key = ?', [(key,) for key, _ in victims])
+        for _, namespace in victims:
+            self.stats.add(namespace, 'evictions')
+
+    def _error(self, namespace, error):
+        self.stats.add(namespace, 'errors')
+        logging.warning(f"SQLite cache error: {str(error)}")
+
+
+class RESPError(Exception):
+    pass
+
+
+class RESPConnection:
+    """
+    Just enough of the Redis serialization protocol (RESP2) for a cache client.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def command(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(f"${len(arg)}\r\n".encode())
+            parts.append(arg)
+            parts.append(b"\r\n")
+        self.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_line(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError('Connection closed by cache server')
+        return line[:-2]
+
+    def _read_reply(self):
+        line = self._read_line()
+        kind, rest = line[:1], line[1:]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RESPError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Connection closed by cache server')
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RESPError(f"Unexpected reply {line[:20]!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(CacheBackend):
+    """
+    Cache shared across nodes through any server speaking the Redis protocol
+    (Redis, Valkey, KeyDB, or the stand-in in resp_server.py). Eviction is
+    the server's job (maxmemory-policy allkeys-lru); its evicted_keys counter
+    is reported in info().
+
+    After a connection failure the backend reports misses without trying
+    the server for `retry_after` seconds, so an outage costs one timeout
+    rather than one per request.
+    """
+    name = 'redis'
+    shared = True
+
+    def __init__(self, url, key_prefix='', timeout=0.25, retry_after=5.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._local = threading.local()
+        self._down_until = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        if time.monotonic() < self._down_until:
+            raise ConnectionError('Cache server marked unavailable')
+
+        conn = RESPConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.command('AUTH', self.password)
+        if self.db:
+            conn.command('SELECT', self.db)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _command(self, namespace, *args):
+        try:
+            return self._connection().command(*args)
+        except RESPError as e:
+            self._error(namespace, e)
+        except (OSError, ValueError) as e:
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn.close()
+                self._local.conn = None
+            self._down_until = time.monotonic() + self.retry_after
+            self._error(namespace, e)
+        return MISSING
+
+    def get(self, namespace, key):
+        reply = self._command(namespace, 'GET', _storage_key(self.key_prefix, namespace, key))
+        if reply is MISSING:
+            return MISSING
+        if reply is None:
+            self.stats.add(namespace, 'misses')
+            return MISSING
+        try:
+            value = pickle.loads(reply)
+        except (pickle.UnpicklingError, EOFError) as e:
+            self._error(namespace, e)
+            return MISSING
+        self.stats.add(namespace, 'hits')
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        args = ['SET', _storage_key(self.key_prefix, namespace, key), _dumps(value)]
+        if ttl:
+            args += ['PX', int(ttl * 1000)]
+        if self._command(namespace, *args) is not MISSING:
+            self.stats.add(namespace, 'sets')
+
+    def delete(self, namespace, key):
+        self._command(namespace, 'DEL', _storage_key(self.key_prefix, namespace, key))
+
+    def clear(self):
+        # Only our own keys; the server may be shared with other applications
+        cursor = b'0'
+        while True:
+            reply = self._command('_admin', 'SCAN', cursor, 'MATCH', f"{self.key_prefix}*", 'COUNT', 500)
+            if reply is MISSING:
+                return
+            cursor, keys = reply
+            if keys:
+                self._command('_admin', 'DEL', *keys)
+            if cursor in (b'0', '0'):
+                return
+
+    def info(self):
+        reply = self._command('_admin', 'INFO')
+        if reply is MISSING or reply is None:
+            return {'server': f"{self.host}:{self.port}/{self.db}", 'available': False}
+        fields = dict(
+            line.split(':', 1) for line in reply.decode('utf-8').splitlines() if ':' in line
+        )
+        return {
+            'server': f"{self.host}:{self.port}/{self.db}",
+            'available': True,
+            'evicted_keys': int(fields.get('evicted_keys', 0)),
+            'used_memory': int(fields.get('used_memory', 0)),
+        }
+
+    def _error(self, namespace, error):
+        self.stats.add(namespace, 'errors')
+        logging.warning(f"Redis cache error: {str(error)}")
+
+
+def create_backend(config, instance_path='instance'):
+    """
+    Build the backend selected by CACHE_BACKEND / CACHE_URL.
+    """
+    backend = config.get('CACHE_BACKEND', 'memory')
+    max_entries = config.get('CACHE_MAX_ENTRIES', 2048)
+    max_bytes = config.get('CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    prefix = config.get('CACHE_KEY_PREFIX', '')
+
+    if backend == 'memory':
+        return MemoryBackend(max_entries, max_bytes)
+    if backend == 'sqlite':
+        url = config.get('CACHE_URL') or os.path.join(instance_path, 'cache.sqlite3')
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        return SQLiteBackend(path, max_entries, max_bytes, key_prefix=prefix)
+    if backend == 'redis':
+        return RedisBackend(config.get('CACHE_URL') or 'redis://localhost:6379/0', key_prefix=prefix,
+                            timeout=config.get('CACHE_TIMEOUT', 0.25))
+    raise ValueError(f"Unknown CACHE_BACKEND {backend!r} (expected memory, sqlite or redis)")
+
+
+class Cache:
+    """
+    The application's cache; delegates to the configured backend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config, app.instance_path)
+        app.extensions['cache'] = self
+
+    @property
+    def shared(self):
+        return self.backend.shared
+
+    def get(self, namespace, key):
+        return self.backend.get(namespace, key)
+
+    def set(self, namespace, key, value, ttl=None):
+        self.backend.set(namespace, key, value, ttl)
+
+    def delete(self, namespace, key):
+        self.backend.delete(namespace, key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def metrics(self):
+        return self.backend.metrics()
+
+
+cache = Cache()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadResult:
+    def __init__(self, text, status, fetched_at):
+        self.text = text
+        self.status = status  # downloaded, not_modified, resumed, cached
+        self.fetched_at = fetched_at
+
+
+def make_session(pool_size=8):
+    # requests is only needed once a worker actually downloads something
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = 'CarbonFootprintTracker/1.0'
+    return session
+
+
+class CachedDownloader:
+    """
+    Downloads text files through a pooled session and keeps the raw copy on disk.
+
+    Repeat downloads send If-None-Match / If-Modified-Since so an unchanged
+    file costs a 304, interrupted downloads are resumed with a Range request
+    (guarded by If-Range), and `read_cached` lets a cold worker start from the
+    local copy without touching the network.
+    """
+
+    def __init__(self, cache_dir=None, session=None):
+        self.cache_dir = cache_dir
+        self._session = session
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._locks_guard:
+                if self._session is None:
+                    self._session = make_session()
+        return self._session
+
+    def read_cached(self, url):
+        """
+        Return the last complete copy of `url` as a DownloadResult, or None.
+        """
+        if not self.cache_dir:
+            return None
+        data_path, meta_path, _, _ = self._paths(url)
+        meta = self._load_meta(meta_path)
+        if meta is None or not os.path.exists(data_path):
+            return None
+        with open(data_path, encoding='utf-8', errors='replace') as f:
+            return DownloadResult(f.read(), 'cached', meta.get('fetched_at'))
+
+    def fetch(self, url, timeout):
+        """
+        Fetch `url`, revalidating or resuming the on-disk copy when possible.
+        Returns a DownloadResult, or None if the server had no usable response.
+        """
+        if not self.cache_dir:
+            response = self.session.get(url, timeout=timeout)
+            if response.status_code != 200:
+                return None
+            return DownloadResult(response.text, 'downloaded', time.time())
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._url_lock(url):
+            data_path, meta_path, part_path, lock_path = self._paths(url)
+
+            if not self._acquire_file_lock(lock_path, timeout):
+                # Another worker on this host is refreshing the same file
+                return self.read_cached(url)
+            try:
+                return self._fetch_locked(url, timeout, data_path, meta_path, part_path)
+            finally:
+                self._release_file_lock(lock_path)
+
+    def _fetch_locked(self, url, timeout, data_path, meta_path, part_path):
+        meta = self._load_meta(meta_path) if os.path.exists(data_path) else None
+        part_meta = self._load_meta(part_path + '.json')
+        part_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        headers = {}
+        resuming = part_size > 0 and part_meta and (part_meta.get('etag') or part_meta.get('last_modified'))
+        if resuming:
+            headers['Range'] = f'bytes={part_size}-'
+            headers['If-Range'] = part_meta.get('etag') or part_meta.get('last_modified')
+        elif meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        with self.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and meta:
+                meta['fetched_at'] = time.time()
+                self._write_meta(meta_path, meta)
+                with open(data_path, encoding='utf-8', errors='replace') as f:
+                    return DownloadResult(f.read(), 'not_modified', meta['fetched_at'])
+
+            if response.status_code == 416:
+                # Our partial copy no longer matches; start over next time
+                self._discard_part(part_path)
+                return None
+
+            if response.status_code == 206 and resuming:
+                mode, status = 'ab', 'resumed'
+            elif response.status_code == 200:
+                mode, status = 'wb', 'downloaded'
+            else:
+                return None
+
+            validators = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            if mode == 'wb':
+                self._write_meta(part_path + '.json', validators)
+            else:
+                validators = part_meta
+
+            # Stream to the partial file so an interrupted download can be resumed
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+        with open(part_path, 'rb') as f:
+            text = f.read().decode('utf-8', errors='replace')
+
+        os.replace(part_path, data_path)
+        meta = dict(validators, fetched_at=time.time(), size=os.path.getsize(data_path))
+        self._write_meta(meta_path, meta)
+        self._discard_part(part_path)
+        return DownloadResult(text, status, meta['fetched_at'])
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        name = url.rstrip('/').rsplit('/', 1)[-1] or 'index'
+        base = os.path.join(self.cache_dir, f"{key}-{name}")
+        return base, base + '.json', base + '.part', base + '.lock'
+
+    def _url_lock(self, url):
+        with self._locks_guard:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def _acquire_file_lock(self, lock_path, timeout):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Break locks left behind by a worker that died mid-download
+            try:
+                if time.time() - os.path.getmtime(lock_path) < 2 * timeout + 30:
+                    return False
+                os.remove(lock_path)
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+
+    def _release_file_lock(self, lock_path):
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+    def _discard_part(self, part_path):
+        for path in (part_path, part_path + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_meta(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path, meta):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
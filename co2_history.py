@@ -0,0 +1,133 @@
+import threading
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+class CO2History:
+    """
+    Daily global CO2 series parsed once from the NOAA trend file.
+
+    Dates are stored as proleptic ordinals in one array and ppm values in a
+    parallel array, so lookups are a bisect and slices are cheap.
+    """
+
+    def __init__(self, ordinals=None, values=None):
+        self.ordinals = ordinals if ordinals is not None else array('l')
+        self.values = values if values is not None else array('d')
+
+    @classmethod
+    def from_trend_text(cls, text):
+        # Format: Year Month Day smoothed trend
+        ordinals = array('l')
+        values = array('d')
+        for line in text.splitlines():
+            if not line.strip() or line.startswith('#'):
+                continue
+            parts = line.split()
+            if len(parts) < 4:
+                continue
+            ordinals.append(date(int(parts[0]), int(parts[1]), int(parts[2])).toordinal())
+            values.append(float(parts[3]))
+        return cls(ordinals, values)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def latest(self):
+        """
+        Returns (date, ppm) for the most recent reading, or (None, None).
+        """
+        if not self.ordinals:
+            return None, None
+        return date.fromordinal(self.ordinals[-1]), self.values[-1]
+
+    def value_on_or_before(self, day):
+        i = bisect_right(self.ordinals, day.toordinal())
+        if i == 0:
+            return None
+        return self.values[i - 1]
+
+    def last_in_month(self, year, month):
+        """
+        Latest reading within the given calendar month, or None.
+        """
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        i = bisect_left(self.ordinals, next_month.toordinal())
+        if i == 0 or self.ordinals[i - 1] < date(year, month, 1).toordinal():
+            return None
+        return self.values[i - 1]
+
+    def series(self, start=None, end=None, max_points=None):
+        """
+        Returns (dates, values) between `start` and `end` inclusive. When
+        `max_points` is given the range is averaged into at most that many
+        equal-sized buckets, each labelled with its first date.
+        """
+        lo = bisect_left(self.ordinals, start.toordinal()) if start else 0
+        hi = bisect_right(self.ordinals, end.toordinal()) if end else len(self.ordinals)
+        count = max(hi - lo, 0)
+
+        if not max_points or count <= max_points:
+            dates = [date.fromordinal(o) for o in self.ordinals[lo:hi]]
+            return dates, list(self.values[lo:hi])
+
+        dates = []
+        values = []
+        for bucket in range(max_points):
+            b_lo = lo + bucket * count // max_points
+            b_hi = lo + (bucket + 1) * count // max_points
+            if b_hi <= b_lo:
+                continue
+            chunk = self.values[b_lo:b_hi]
+            dates.append(date.fromordinal(self.ordinals[b_lo]))
+            values.append(sum(chunk) / len(chunk))
+        return dates, values
+
+
+class CO2HistoryStore:
+    """
+    Holds the most recently parsed CO2History. Re-parsing is skipped when
+    the source text has not changed (e.g. after a 304 revalidation).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = CO2History()
+        self._text_key = None
+
+    def update_from_text(self, text):
+        # Stable across processes, so workers can tell they hold the same version
+        key = (len(text), zlib.crc32(text.encode('utf-8')))
+        with self._lock:
+            if key == self._text_key:
+                return self._history
+
+        history = CO2History.from_trend_text(text)
+        with self._lock:
+            self._history = history
+            self._text_key = key
+        return history
+
+    def get(self):
+        with self._lock:
+            return self._history
+
+    def snapshot(self):
+        """
+        (history, key of the text it was parsed from), for sharing with other workers.
+        """
+        with self._lock:
+            return self._history, self._text_key
+
+    def replace(self, history, key):
+        """
+        Take a history another worker parsed from the text with `key`.
+        """
+        with self._lock:
+            self._history = history
+            self._text_key = key
+
+
+co2_history_store = CO2HistoryStore()
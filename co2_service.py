@@ -0,0 +1,281 @@
+import logging
+import os
+import threading
+import time
+
+from utils import get_global_co2_data
+from co2_sources import co2_engine
+from co2_history import co2_history_store
+from cache_backends import cache, MISSING
+
+# Shown when no successful fetch has happened yet in this process
+FALLBACK_CO2_DATA = {
+    "success": True,
+    "co2_level": 420.0,  # Approximate current value as of 2023
+    "trend": "up",
+    "trend_value": 2.5,
+    "date": "Recent estimate",
+    "source": "Fallback data based on recent trends",
+    "unit": "ppm",
+    "is_fallback": True
+}
+
+
+class CO2DataService:
+    """
+    Keeps the last good global CO2 reading in memory and refreshes it from a
+    background thread, so request handlers never wait on an outbound fetch.
+
+    Readings older than the TTL are still served (flagged as stale) while a
+    refresh is scheduled in the background. A cold process is seeded from the
+    on-disk copy of the source files before its first refresh.
+
+    With a shared cache backend, each good reading is published there and
+    the other workers adopt it instead of fetching it again themselves,
+    along with the parsed NOAA history behind it.
+    """
+    # Where readings (and the history they came with) are shared between workers
+    shared_namespace = 'co2'
+    shared_key = 'latest'
+    shared_history_key = 'history'
+    # How often a worker without a fresh reading looks at the shared one (seconds)
+    shared_check_interval = 5.0
+
+    def __init__(self, fetcher=get_global_co2_data, seeder=co2_engine.load_cached, ttl=3600,
+                 refresh_interval=900, retry_interval=60, history_store=None):
+        self.fetcher = fetcher
+        self.seeder = seeder
+        self.history_store = history_store or co2_history_store
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self._data = None
+        self._fetched_at = None
+        self._last_attempt = None
+        self._refreshing = False
+        self._last_error = None
+        self._last_shared_check = None
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'last_refresh_seconds': None,
+            'seeded_from_disk': False,
+            'adopted_from_cache': 0,
+        }
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CO2_CACHE_TTL', self.ttl)
+        self.refresh_interval = app.config.get('CO2_REFRESH_INTERVAL', self.refresh_interval)
+        self.retry_interval = app.config.get('CO2_RETRY_INTERVAL', self.retry_interval)
+        app.extensions['co2_service'] = self
+
+    def get_data(self):
+        """
+        Return the cached CO2 reading without blocking on the network.
+        """
+        self.start()
+
+        if self._data is None or self._age() > self.ttl:
+            self._adopt_shared()
+
+        with self._lock:
+            data = self._data
+            age = self._age()
+
+            if data is None:
+                self._stats['misses'] += 1
+            elif age > self.ttl:
+                self._stats['stale_hits'] += 1
+            else:
+                self._stats['hits'] += 1
+
+        if data is None:
+            self._request_refresh()
+            return dict(FALLBACK_CO2_DATA, cache_age=None)
+
+        if age > self.ttl:
+            # Serve the stale value now and let the worker revalidate it
+            self._request_refresh()
+            return dict(data, cache_age=age, is_stale=True)
+
+        return dict(data, cache_age=age)
+
+    def refresh(self):
+        """
+        Fetch a new reading synchronously. Failed fetches keep the last good value.
+        Returns True if the cached value was replaced.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._refreshing = True
+            self._last_attempt = started
+        try:
+            data = self.fetcher()
+        except Exception as e:
+            data = {"success": False, "error": str(e)}
+
+        elapsed = time.monotonic() - started
+        ok = bool(data) and data.get('success') and not data.get('is_fallback') and 'co2_level' in data
+
+        with self._lock:
+            self._refreshing = False
+            self._stats['refreshes'] += 1
+            self._stats['last_refresh_seconds'] = round(elapsed, 3)
+            if ok:
+                self._data = data
+                self._fetched_at = time.time()
+                self._last_error = None
+                fetched_at = self._fetched_at
+            else:
+                self._stats['refresh_failures'] += 1
+                self._last_error = (data or {}).get('error', 'No source returned data')
+
+        if ok and cache.shared:
+            self._publish(data, fetched_at)
+        if not ok:
+            logging.warning(f"Global CO2 refresh failed: {self._last_error}")
+        return ok
+
+    def start(self):
+        """
+        Start the refresh thread for this process (safe to call repeatedly and after fork).
+        """
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._data is None:
+                self._seed()
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            # The new thread refreshes immediately, so don't queue a second one
+            self._refreshing = True
+            self._thread = threading.Thread(target=self._run, name='co2-refresh', daemon=True)
+            self._thread.start()
+
+    def metrics(self):
+        with self._lock:
+            age = self._age() if self._data is not None else None
+            return dict(
+                self._stats,
+                cache_age=age,
+                is_stale=age is not None and age > self.ttl,
+                has_data=self._data is not None,
+                source=self._data.get('source') if self._data else None,
+                last_error=self._last_error,
+                ttl=self.ttl,
+                refresh_interval=self.refresh_interval,
+            )
+
+    def _seed(self):
+        # Local reads only; the refresh thread does the network round trip.
+        # Caller holds the lock.
+        entry = self._shared_reading(force=True)
+        if (entry is not None and self._adopt(entry)) or self.seeder is None:
+            return
+        try:
+            _, data, fetched_at = self.seeder()
+        except Exception as e:
+            logging.warning(f"Could not seed global CO2 cache from disk: {str(e)}")
+            return
+        if data:
+            self._data = data
+            self._fetched_at = fetched_at or time.time()
+            self._stats['seeded_from_disk'] = True
+
+    def _publish(self, data, fetched_at):
+        history, history_key = self.history_store.snapshot()
+        if len(history):
+            # Written first, so a worker adopting the reading finds its history
+            cache.set(self.shared_namespace, self.shared_history_key, {'key': history_key, 'history': history})
+        else:
+            history_key = None
+        cache.set(self.shared_namespace, self.shared_key,
+                  {'data': data, 'fetched_at': fetched_at, 'history_key': history_key})
+
+    def _has_recent_shared_reading(self):
+        if not cache.shared:
+            return False
+        self._adopt_shared(force=True)
+        age = self._age()
+        return age is not None and age < self.refresh_interval
+
+    def _adopt_shared(self, force=False):
+        """
+        Take the reading another worker published to the shared cache if it
+        is newer than ours. Returns True if one was adopted.
+        """
+        entry = self._shared_reading(force)
+        if entry is None:
+            return False
+        with self._lock:
+            return self._adopt(entry)
+
+    def _shared_reading(self, force=False):
+        # At most one shared-cache lookup per interval, unless forced
+        if not cache.shared:
+            return None
+        now = time.monotonic()
+        if not force and self._last_shared_check is not None \
+                and now - self._last_shared_check < self.shared_check_interval:
+            return None
+        self._last_shared_check = now
+        entry = cache.get(self.shared_namespace, self.shared_key)
+        return None if entry is MISSING else entry
+
+    def _adopt(self, entry):
+        # Caller holds the lock
+        if self._fetched_at is not None and self._fetched_at >= entry['fetched_at']:
+            return False
+        self._data = entry['data']
+        self._fetched_at = entry['fetched_at']
+        self._last_error = None
+        self._stats['adopted_from_cache'] += 1
+        self._adopt_history(entry.get('history_key'))
+        return True
+
+    def _adopt_history(self, key):
+        # The adopted reading was parsed from NOAA text this worker never
+        # downloaded; take the history parsed alongside it
+        if key is None or self.history_store.snapshot()[1] == key:
+            return
+        entry = cache.get(self.shared_namespace, self.shared_history_key)
+        if entry is not MISSING and entry['key'] == key:
+            self.history_store.replace(entry['history'], key)
+
+    def _age(self):
+        if self._fetched_at is None:
+            return None
+        return round(time.time() - self._fetched_at, 1)
+
+    def _request_refresh(self):
+        # Wake the worker unless it is already busy or has just tried
+        with self._lock:
+            if self._refreshing:
+                return
+            if self._last_attempt is not None and time.monotonic() - self._last_attempt < self.retry_interval:
+                return
+        self._wakeup.set()
+
+    def _run(self):
+        wakeup = self._wakeup
+        while True:
+            # Skip the fetch when another worker has just published a reading
+            ok = self._has_recent_shared_reading() or self.refresh()
+            # Retry sooner while we have nothing good to show
+            wakeup.wait(self.refresh_interval if ok else self.retry_interval)
+            wakeup.clear()
+
+
+co2_service = CO2DataService()
@@ -0,0 +1,397 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from co2_download import CachedDownloader
+from co2_history import co2_history_store
+
+NOAA_TREND_URL = "https://gml.noaa.gov/webdata/ccgg/trends/co2/co2_trend_gl.txt"
+MAUNA_LOA_WEEKLY_URL = "https://www.esrl.noaa.gov/gmd/webdata/ccgg/trends/co2_mlo_weekly.txt"
+CO2_EARTH_URL = "https://www.co2.earth/"
+
+MONTH_NAMES = ["", "January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+
+
+class SourceCancelled(Exception):
+    pass
+
+
+def fetch_text(url, timeout, downloader):
+    """
+    Fetch a text document. `file://` URLs are read from disk so local
+    stand-ins can replace the NOAA endpoints in tests and benchmarks.
+    """
+    if url.startswith('file://'):
+        with open(url[len('file://'):], encoding='utf-8') as f:
+            return f.read()
+
+    result = downloader.fetch(url, timeout)
+    return result.text if result else None
+
+
+def data_lines(text):
+    lines = text.strip().split('\n')
+    return [line for line in lines if not line.startswith('#') and line.strip()]
+
+
+class CO2Source:
+    """
+    Base class for a global CO2 data source.
+
+    `fetch` returns the ticker dict, or None if the source had no usable data.
+    Lower `priority` values are preferred when several sources answer.
+    Subclasses normally only implement `parse`.
+    """
+    name = None
+    priority = 100
+    url = None
+
+    def __init__(self, url=None, priority=None, downloader=None):
+        if url is not None:
+            self.url = url
+        if priority is not None:
+            self.priority = priority
+        self.downloader = downloader or CachedDownloader()
+
+    def fetch(self, timeout, cancelled):
+        text = fetch_text(self.url, timeout, self.downloader)
+        if cancelled.is_set():
+            raise SourceCancelled()
+        if not text:
+            return None
+        return self.parse(text)
+
+    def load_cached(self):
+        """
+        Parse the on-disk copy from the last successful download.
+        Returns (data, fetched_at) or (None, None).
+        """
+        if self.url.startswith('file://'):
+            return None, None
+        result = self.downloader.read_cached(self.url)
+        if result is None:
+            return None, None
+        return self.parse(result.text), result.fetched_at
+
+    def cached_text(self):
+        """
+        Text of the on-disk copy from the last successful download (or of a
+        local file:// stand-in), without network access. None if there is none.
+        """
+        if self.url.startswith('file://'):
+            return fetch_text(self.url, None, self.downloader)
+        result = self.downloader.read_cached(self.url)
+        return result.text if result else None
+
+    def parse(self, text):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name} priority={self.priority}>"
+
+
+class NOAATrendSource(CO2Source):
+    name = 'noaa_trend'
+    priority = 0
+    url = NOAA_TREND_URL
+
+    def __init__(self, url=None, priority=None, downloader=None, history_store=None):
+        super().__init__(url=url, priority=priority, downloader=downloader)
+        self.history_store = history_store or co2_history_store
+
+    def parse(self, text):
+        # Parsed once per file version into the shared history store
+        history = self.history_store.update_from_text(text)
+        latest_date, co2_level = history.latest()
+        if latest_date is None:
+            return None
+
+        # Get historical data for context (one year ago)
+        one_year_ago = history.last_in_month(latest_date.year - 1, latest_date.month)
+
+        # Determine trend
+        trend = "stable"
+        trend_value = 0
+        if one_year_ago:
+            trend_value = co2_level - one_year_ago
+            if trend_value > 0:
+                trend = "up"
+            elif trend_value < 0:
+                trend = "down"
+
+        return {
+            "success": True,
+            "co2_level": co2_level,
+            "trend": trend,
+            "trend_value": abs(trend_value),
+            "date": f"{MONTH_NAMES[latest_date.month]} {latest_date.year}",
+            "source": "NOAA Global Monitoring Laboratory",
+            "unit": "ppm",
+            "historical": {
+                "one_year_ago": one_year_ago
+            }
+        }
+
+
+class MaunaLoaWeeklySource(CO2Source):
+    name = 'mauna_loa_weekly'
+    priority = 10
+    url = MAUNA_LOA_WEEKLY_URL
+
+    def parse(self, text):
+        lines = data_lines(text)
+        if not lines:
+            return None
+
+        latest_data = lines[-1].split()
+        if len(latest_data) < 5:
+            return None
+
+        year = latest_data[0]
+        month = int(latest_data[1])
+        co2_level = float(latest_data[4])
+
+        # Get trend (compare to previous week)
+        trend = "stable"
+        trend_value = 0
+        if len(lines) > 1:
+            prev_data = lines[-2].split()
+            if len(prev_data) >= 5:
+                prev_co2 = float(prev_data[4])
+                trend_value = co2_level - prev_co2
+                if trend_value > 0:
+                    trend = "up"
+                elif trend_value < 0:
+                    trend = "down"
+
+        return {
+            "success": True,
+            "co2_level": co2_level,
+            "trend": trend,
+            "trend_value": abs(trend_value),
+            "date": f"{MONTH_NAMES[month]} {year}",
+            "source": "Mauna Loa Observatory",
+            "unit": "ppm"
+        }
+
+
+class CO2EarthSource(CO2Source):
+    name = 'co2_earth'
+    priority = 20
+    url = CO2_EARTH_URL
+
+    def parse(self, html):
+        # Heavy (lxml, htmldate, courlan...) and only needed by this fallback source
+        import trafilatura
+
+        text = trafilatura.extract(html)
+        if not text:
+            return None
+
+        # Try to extract the current CO2 value using regex
+        co2_match = re.search(r'(\d{3}\.\d{2})\s*ppm', text)
+        if not co2_match:
+            return None
+
+        return {
+            "success": True,
+            "co2_level": float(co2_match.group(1)),
+            "trend": "unknown",  # Can't determine trend from this source
+            "date": "Recent data",
+            "source": "CO2.Earth",
+            "unit": "ppm"
+        }
+
+
+class CO2FetchEngine:
+    """
+    Queries all sources concurrently and returns the highest-priority
+    successful answer available within one overall deadline.
+
+    Lower-priority answers are only used once every better source has failed
+    or the deadline has passed. Sources still running when a winner is picked
+    are cancelled (queued ones never start; running ones discard their result).
+    """
+
+    def __init__(self, sources=None, deadline=10.0, downloader=None):
+        self.downloader = downloader or CachedDownloader()
+        self.sources = list(sources) if sources is not None else default_sources(downloader=self.downloader)
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def init_app(self, app):
+        self.deadline = app.config.get('CO2_FETCH_DEADLINE', self.deadline)
+        self.downloader.cache_dir = app.config.get('CO2_CACHE_DIR') or os.path.join(app.instance_path, 'co2_cache')
+        self.sources = default_sources(
+            noaa_url=app.config.get('CO2_NOAA_TREND_URL'),
+            mauna_loa_url=app.config.get('CO2_MAUNA_LOA_URL'),
+            co2_earth_url=app.config.get('CO2_EARTH_URL'),
+            downloader=self.downloader,
+        )
+        app.extensions['co2_engine'] = self
+
+    def fetch(self):
+        """
+        Returns (source, data) for the winning source, or (None, None) if none answered.
+        """
+        if not self.sources:
+            return None, None
+
+        ranked = sorted(self.sources, key=lambda s: s.priority)
+        deadline_at = time.monotonic() + self.deadline
+        cancelled = threading.Event()
+        results = {}
+
+        executor = ThreadPoolExecutor(max_workers=len(ranked), thread_name_prefix='co2-source')
+        futures = {executor.submit(self._run_source, source, deadline_at, cancelled): source
+                   for source in ranked}
+        pending = set(futures)
+        winner = None
+
+        try:
+            while pending:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+
+                winner = self._pick(ranked, results, final=False)
+                if winner is not None:
+                    break
+
+            if winner is None:
+                # Deadline passed or everything finished: take the best we have
+                winner = self._pick(ranked, results, final=True)
+        finally:
+            cancelled.set()
+            for future in pending:
+                # Queued sources never start; running ones see the event and bail out
+                if future.cancel():
+                    self._record(futures[future], 'cancelled', None)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if winner is None:
+            return None, None
+        return winner, results[winner]
+
+    def load_cached(self):
+        """
+        Best reading available from the on-disk copies, without any network access.
+        Returns (source, data, fetched_at) or (None, None, None).
+        """
+        for source in sorted(self.sources, key=lambda s: s.priority):
+            try:
+                data, fetched_at = source.load_cached()
+            except Exception as e:
+                logging.warning(f"Could not parse cached copy for CO2 source {source.name}: {str(e)}")
+                continue
+            if data is not None:
+                return source, data, fetched_at
+        return None, None, None
+
+    def load_history(self):
+        """
+        Parse the NOAA trend file's on-disk copy into the history store if
+        this process has not parsed one yet. Returns the store's history.
+        """
+        history = co2_history_store.get()
+        if len(history):
+            return history
+        for source in self.sources:
+            if not isinstance(source, NOAATrendSource):
+                continue
+            try:
+                text = source.cached_text()
+            except Exception as e:
+                logging.warning(f"Could not read cached copy for CO2 source {source.name}: {str(e)}")
+                continue
+            if text:
+                return source.history_store.update_from_text(text)
+        return history
+
+    def metrics(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _pick(self, ranked, results, final):
+        for source in ranked:
+            if source not in results:
+                if final:
+                    continue
+                # A better source is still running; wait for it
+                return None
+            if results[source] is not None:
+                return source
+        return None
+
+    def _run_source(self, source, deadline_at, cancelled):
+        if cancelled.is_set():
+            self._record(source, 'cancelled', None)
+            return None
+
+        timeout = max(deadline_at - time.monotonic(), 0.1)
+        started = time.monotonic()
+        try:
+            data = source.fetch(timeout, cancelled)
+        except SourceCancelled:
+            self._record(source, 'cancelled', None)
+            return None
+        except Exception as e:
+            logging.warning(f"CO2 source {source.name} failed: {str(e)}")
+            self._record(source, 'failure', time.monotonic() - started, error=str(e))
+            return None
+
+        elapsed = time.monotonic() - started
+        if data is None:
+            self._record(source, 'empty', elapsed)
+        else:
+            self._record(source, 'success', elapsed)
+        return data
+
+    def _record(self, source, outcome, latency, error=None):
+        with self._lock:
+            stats = self._stats.setdefault(source.name, {
+                'calls': 0,
+                'successes': 0,
+                'failures': 0,
+                'empty': 0,
+                'cancelled': 0,
+                'last_latency': None,
+                'avg_latency': None,
+                'last_error': None,
+            })
+            stats['calls'] += 1
+            if outcome == 'success':
+                stats['successes'] += 1
+            elif outcome == 'failure':
+                stats['failures'] += 1
+                stats['last_error'] = error
+            elif outcome == 'empty':
+                stats['empty'] += 1
+            else:
+                stats['cancelled'] += 1
+
+            if latency is not None:
+                timed = stats['calls'] - stats['cancelled']
+                previous = stats['avg_latency'] or 0
+                stats['avg_latency'] = round(previous + (latency - previous) / timed, 4)
+                stats['last_latency'] = round(latency, 4)
+
+
+def default_sources(noaa_url=None, mauna_loa_url=None, co2_earth_url=None, downloader=None):
+    downloader = downloader or CachedDownloader()
+    return [
+        NOAATrendSource(url=noaa_url, downloader=downloader),
+        MaunaLoaWeeklySource(url=mauna_loa_url, downloader=downloader),
+        CO2EarthSource(url=co2_earth_url, downloader=downloader),
+    ]
+
+
+co2_engine = CO2FetchEngine()
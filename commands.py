@@ -0,0 +1,396 @@
+import io
+import functools
+import shutil
+import tempfile
+
+import click
+from flask import current_app
+
+from app import db
+from schema import init_schema
+
+
+def _same_database(a, b):
+    if a.get_backend_name() == 'sqlite' and b.get_backend_name() == 'sqlite':
+        return bool(a.database) and a.database == b.database
+    return (a.get_backend_name(), a.host, a.port, a.database) == (b.get_backend_name(), b.host, b.port, b.database)
+
+
+def scratch_database(command):
+    """
+    Run a command that writes synthetic data against the database named by
+    its required --scratch-db option (never the configured one).
+    """
+    @click.option('--scratch-db', required=True, metavar='URL',
+                  help="Throwaway database to write to, or 'temp' for a temporary SQLite file.")
+    @functools.wraps(command)
+    def wrapper(scratch_db, **kwargs):
+        from app import create_app
+        from database import database_uri
+
+        directory = None
+        if scratch_db == 'temp':
+            directory = tempfile.mkdtemp(prefix='ct-scratch-')
+            scratch_db = f"sqlite:///{directory}/scratch.db"
+        configured = db.engine.url
+
+        # Its own app, so nothing (replica, shared cache) reaches the real deployment
+        scratch = create_app({'SQLALCHEMY_DATABASE_URI': database_uri(scratch_db), 'DATABASE_REPLICA_URL': None,
+                              'CACHE_BACKEND': 'memory', 'DB_INIT_ON_START': False})
+        try:
+            with scratch.app_context():
+                # Compared once resolved (relative SQLite paths land in the instance folder)
+                if _same_database(db.engine.url, configured):
+                    raise click.ClickException("--scratch-db must not be the configured database")
+                init_schema()
+                return command(**kwargs)
+        finally:
+            with scratch.app_context():
+                for engine in db.engines.values():
+                    engine.dispose()
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    return wrapper
+
+
+def register_commands(app):
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create missing tables and indexes."""
+        init_schema()
+        click.echo('Database schema is up to date.')
+
+    @app.cli.command('backfill-emission-kg')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows updated per transaction.')
+    def backfill_emission_kg_command(batch_size):
+        """Populate canonical kg values for rows written before they existed."""
+        from rollups import rebuild_rollups
+        from schema import backfill_emission_kg
+
+        updated = backfill_emission_kg(batch_size)
+        if updated:
+            rebuild_rollups()
+        click.echo(f"Backfilled {updated} rows.")
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--company-id', type=int, default=None, help='Only rebuild this company.')
+    def rebuild_rollups_command(company_id):
+        """Recompute the monthly emission rollup table from activities."""
+        from rollups import rebuild_rollups
+
+        rows = rebuild_rollups(company_id)
+        click.echo(f"Wrote {rows} rollup rows.")
+
+    @app.cli.command('bench-stats')
+    @click.option('--activities', default=50000, show_default=True, help='Synthetic activities to generate.')
+    @click.option('--runs', default=20, show_default=True, help='Timed calls per variant.')
+    @scratch_database
+    def bench_stats_command(activities, runs):
+        """Compare query count and latency of the old and new emission stats."""
+        from datetime import date, timedelta
+        from bench import bench_company, legacy_emission_stats, measure
+        from stats import compute_emission_stats
+
+        if db.engine.dialect.name != 'sqlite':
+            raise click.ClickException("bench-stats compares against the original queries, which only run on SQLite")
+
+        with bench_company(activities) as company:
+            from_date = date.today() - timedelta(days=400)
+            to_date = date.today() - timedelta(days=45)
+            cases = [
+                ('all time', None, None),
+                ('date range', from_date, to_date),
+            ]
+            for label, start, end in cases:
+                before = measure(lambda: legacy_emission_stats(company.id, start, end), runs)
+                after = measure(lambda: compute_emission_stats(company.id, start, end), runs)
+                click.echo(f"{label} ({activities} activities)")
+                click.echo(f"    before: {before[0]:.0f} queries, {before[1] * 1000:.2f} ms")
+                click.echo(f"    after:  {after[0]:.0f} queries, {after[1] * 1000:.2f} ms")
+
+    @app.cli.command('import-activities')
+    @click.argument('company_id', type=int)
+    @click.argument('path', type=click.File('rb'))
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows validated and inserted per transaction.')
+    def import_activities_command(company_id, path, batch_size):
+        """Import activities for COMPANY_ID from the CSV file at PATH."""
+        from models import Company
+        from importer import import_activities_csv
+
+        if db.session.get(Company, company_id) is None:
+            raise click.ClickException(f"No company with id {company_id}")
+
+        result = import_activities_csv(path, company_id, batch_size)
+        for line, message in result.errors:
+            click.echo(f"line {line}: {message}", err=True)
+        if result.error_count > len(result.errors):
+            click.echo(f"... {result.error_count - len(result.errors)} more errors", err=True)
+        click.echo(f"Imported {result.inserted} of {result.rows_read} rows in {result.elapsed:.2f}s "
+                   f"({result.rows_per_second:.0f} rows/s).")
+
+    @app.cli.command('bench-import')
+    @click.option('--rows', default=50000, show_default=True, help='Synthetic CSV rows to import.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+    @scratch_database
+    def bench_import_command(rows, batch_size):
+        """Measure CSV import throughput against the one-commit-per-row path."""
+        import time
+        from bench import bench_company, synthetic_activity_csv, synthetic_activity_rows
+        from importer import import_activities_csv
+        from models import Activity
+
+        data = synthetic_activity_csv(rows)
+        with bench_company(0) as company:
+            result = import_activities_csv(io.BytesIO(data), company.id, batch_size)
+            click.echo(f"bulk import:    {result.inserted} rows in {result.elapsed:.2f}s "
+                       f"({result.rows_per_second:.0f} rows/s, {result.error_count} errors)")
+
+        # The per-form-post path, on a sample so the comparison stays quick
+        sample = min(rows, 1000)
+        with bench_company(0) as company:
+            started = time.perf_counter()
+            for record in synthetic_activity_rows(sample):
+                db.session.add(Activity(company_id=company.id, **record))
+                db.session.commit()
+            elapsed = time.perf_counter() - started
+            click.echo(f"row-at-a-time:  {sample} rows in {elapsed:.2f}s ({sample / elapsed:.0f} rows/s)")
+
+    @app.cli.command('bench-ingest')
+    @click.option('--threads', default=16, show_default=True, help='Concurrent writers.')
+    @click.option('--rows-per-thread', default=100, show_default=True, help='Single-activity submissions per writer.')
+    @scratch_database
+    def bench_ingest_command(threads, rows_per_thread):
+        """Compare one commit per activity with the write-behind ingest buffer."""
+        from bench import bench_company, run_concurrently, synthetic_activity_rows
+        from ingest_buffer import ingest_buffer
+        from models import Activity, to_kg
+
+        app = current_app._get_current_object()  # the scratch app
+        total = threads * rows_per_thread
+        records = list(synthetic_activity_rows(total))
+        for record in records:
+            record['emission_kg'] = to_kg(record['emission_value'], record['emission_unit'])
+
+        with bench_company(0) as company:
+            def direct(thread, call):
+                record = dict(records[thread * rows_per_thread + call])
+                db.session.add(Activity(company_id=company.id, **record))
+                db.session.commit()
+
+            elapsed, errors = run_concurrently(app, direct, threads, rows_per_thread)
+            click.echo(f"commit per row: {total} rows in {elapsed:.2f}s "
+                       f"({total / elapsed:.0f} rows/s, {len(errors)} errors)")
+
+        with bench_company(0) as company:
+            def buffered(thread, call):
+                record = dict(records[thread * rows_per_thread + call])
+                ingest_buffer.submit(company.id, [record]).wait(ingest_buffer.wait_timeout)
+
+            elapsed, errors = run_concurrently(app, buffered, threads, rows_per_thread)
+            ingest_buffer.stop()
+            metrics = ingest_buffer.metrics()
+            click.echo(f"ingest buffer:  {total} rows in {elapsed:.2f}s "
+                       f"({total / elapsed:.0f} rows/s, {len(errors)} errors, "
+                       f"{metrics['flushes']} flushes)")
+
+    @app.cli.command('bench-coalesce')
+    @click.option('--activities', default=50000, show_default=True, help='Synthetic activities to generate.')
+    @click.option('--threads', default=12, show_default=True, help='Concurrent identical requests.')
+    @click.option('--rounds', default=5, show_default=True, help='Cold bursts (each after a data change).')
+    @scratch_database
+    def bench_coalesce_command(activities, threads, rounds):
+        """Time bursts of identical emission stats requests with and without single-flight."""
+        from datetime import date, timedelta
+        from bench import bench_company, run_concurrently
+        from data_version import bump_data_versions
+        from utils import get_emission_stats
+        from view_cache import view_cache
+
+        app = current_app._get_current_object()  # the scratch app
+        from_date = (date.today() - timedelta(days=400)).isoformat()
+        to_date = (date.today() - timedelta(days=45)).isoformat()
+        with bench_company(activities) as company:
+            for coalesce in (False, True):
+                view_cache.coalesce = coalesce
+                before = view_cache.metrics()
+                total = 0
+                for _ in range(rounds):
+                    # A write makes every cached entry stale, as at the start of a meeting
+                    bump_data_versions(db.session.connection(), [company.id])
+                    db.session.commit()
+                    elapsed, errors = run_concurrently(
+                        app, lambda thread, call: get_emission_stats(company.id, from_date, to_date), threads, 1)
+                    total += elapsed
+                    if errors:
+                        raise click.ClickException(f"{len(errors)} errors: {errors[0]}")
+
+                after = view_cache.metrics()
+                if coalesce:
+                    computed = after['single_flight']['executions'] - before['single_flight']['executions']
+                else:
+                    computed = (after['misses'] + after['stale']) - (before['misses'] + before['stale'])
+                click.echo(f"single-flight {'on ' if coalesce else 'off'}: {rounds} bursts of {threads} in "
+                           f"{total:.2f}s ({total / rounds * 1000:.0f} ms per burst), {computed} computations")
+            view_cache.coalesce = app.config['VIEW_CACHE_COALESCE']
+
+    @app.cli.command('bench-cache')
+    @click.option('--backend', 'backends', multiple=True, type=click.Choice(['memory', 'sqlite', 'redis']),
+                  help='Backends to compare (default: all three).')
+    @click.option('--ops', default=5000, show_default=True, help='Gets (and as many sets) per backend.')
+    @click.option('--max-entries', default=1000, show_default=True, help='Size limit, to exercise eviction.')
+    def bench_cache_command(backends, ops, max_entries):
+        """Time get/set per cache backend (redis uses a local stand-in unless configured)."""
+        import os
+        import tempfile
+        import time
+        from cache_backends import create_backend, MISSING
+        from resp_server import serve_in_thread
+
+        server = None
+        payload = {'labels': ['Energy', 'Travel'] * 10, 'values': list(range(20))}
+        for name in backends or ('memory', 'sqlite', 'redis'):
+            config = dict(app.config, CACHE_BACKEND=name, CACHE_MAX_ENTRIES=max_entries,
+                          CACHE_KEY_PREFIX='ct-bench:')
+            if name == 'sqlite':
+                config['CACHE_URL'] = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+            elif name == 'redis' and app.config['CACHE_BACKEND'] != 'redis':
+                server, port = serve_in_thread(max_keys=max_entries)
+                config['CACHE_URL'] = f"redis://127.0.0.1:{port}/0"
+            backend = create_backend(config, app.instance_path)
+
+            started = time.perf_counter()
+            for i in range(ops):
+                backend.set('bench', (i % (max_entries * 2),), payload)
+            set_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            found = sum(backend.get('bench', (i % (max_entries * 2),)) is not MISSING for i in range(ops))
+            get_elapsed = time.perf_counter() - started
+
+            stats = backend.metrics()
+            namespace = stats['namespaces'].get('bench', {})
+            evictions = stats.get('evicted_keys', namespace.get('evictions'))
+            click.echo(f"{name:<7} set {ops / set_elapsed:>8.0f}/s  get {ops / get_elapsed:>8.0f}/s  "
+                       f"hit rate {found / ops:.2f}  evictions {evictions}  errors {namespace.get('errors', 0)}")
+            backend.clear()
+
+        if server is not None:
+            server.shutdown()
+
+    @app.cli.command('create-api-key')
+    @click.argument('company_id', type=int)
+    @click.option('--name', default='default', show_default=True, help='Label to tell keys apart.')
+    def create_api_key_command(company_id, name):
+        """Create an API key for COMPANY_ID and print it once."""
+        from api_keys import create_api_key
+        from models import Company
+
+        if db.session.get(Company, company_id) is None:
+            raise click.ClickException(f"No company with id {company_id}")
+
+        api_key, raw_key = create_api_key(company_id, name)
+        click.echo(f"API key {api_key.id} ({name}) for company {company_id}:")
+        click.echo(raw_key)
+
+    @app.cli.command('revoke-api-key')
+    @click.argument('key_id', type=int)
+    def revoke_api_key_command(key_id):
+        """Revoke the API key with id KEY_ID."""
+        from api_keys import revoke_api_key
+
+        if not revoke_api_key(key_id):
+            raise click.ClickException(f"No active API key with id {key_id}")
+        click.echo(f"Revoked API key {key_id}.")
+
+    @app.cli.command('check-db')
+    def check_db_command():
+        """Connect to the configured database and show the engine settings in effect."""
+        from database import describe_engine
+
+        try:
+            info = describe_engine(db.engine)
+        except Exception as e:
+            raise click.ClickException(f"Cannot connect to {db.engine.url.render_as_string(hide_password=True)}: {e}")
+        for name, value in info.items():
+            click.echo(f"{name:<32} {value}")
+
+    @app.cli.command('startup-profile')
+    @click.option('--runs', default=3, show_default=True, help='Cold boots to take the fastest timings from.')
+    @click.option('--top', default=15, show_default=True, help='Slowest imports to list.')
+    @click.option('--budget-ms', type=float, default=None, help='Fail if a cold boot takes longer than this.')
+    def startup_profile_command(runs, top, budget_ms):
+        """Time a cold boot (imports and create_app) and list the slowest imports."""
+        from startup_profile import profile_startup
+
+        try:
+            profile = profile_startup(app.root_path, runs)
+        except RuntimeError as e:
+            raise click.ClickException(f"Could not boot the app: {e}")
+
+        click.echo(f"boot total   {profile['total_seconds'] * 1000:8.1f} ms  "
+                   f"({profile['modules']} modules loaded)")
+        click.echo(f"  imports    {profile['import_seconds'] * 1000:8.1f} ms")
+        click.echo(f"  create_app {profile['create_app_seconds'] * 1000:8.1f} ms")
+
+        imports = profile['imports']
+        click.echo(f"slowest top-level imports (cumulative ms):")
+        roots = sorted((name for name, (_, _, depth) in imports.items() if depth <= 1),
+                       key=lambda name: -imports[name][1])
+        for name in roots[:top]:
+            click.echo(f"  {name:<32} {imports[name][1] / 1000:8.1f}")
+
+        click.echo(f"project modules (self ms / cumulative ms):")
+        for name in sorted(profile['project_modules'], key=lambda name: -imports[name][1]):
+            self_us, cumulative_us, _ = imports[name]
+            click.echo(f"  {name:<32} {self_us / 1000:8.1f} {cumulative_us / 1000:8.1f}")
+
+        if budget_ms is not None and profile['total_seconds'] * 1000 > budget_ms:
+            raise click.ClickException(
+                f"Cold boot took {profile['total_seconds'] * 1000:.0f} ms, over the {budget_ms:.0f} ms budget"
+            )
+
+    @app.cli.command('check-rollups')
+    @click.option('--activities', default=5000, show_default=True, help='Synthetic activities to generate.')
+    @scratch_database
+    def check_rollups_command(activities):
+        """Fail if rollup-based stats disagree with raw activities for any kind of date range."""
+        from math import isclose
+        from bench import bench_company, raw_monthly_trend, rollup_check_ranges
+        from stats import compute_emission_stats
+
+        failures = 0
+        with bench_company(activities) as company:
+            for label, start, end in rollup_check_ranges():
+                expected = raw_monthly_trend(company.id, start, end)
+                actual = compute_emission_stats(company.id, start, end, top_n=0)['monthly_trend']
+                ok = len(actual) == len(expected) and all(
+                    a[0] == e[0] and isclose(a[1], e[1], rel_tol=1e-9, abs_tol=1e-6)
+                    for a, e in zip(actual, expected)
+                )
+                click.echo(f"{label:<28} {start} .. {end}  {'ok' if ok else 'MISMATCH'}")
+                if not ok:
+                    click.echo(f"    expected {expected}")
+                    click.echo(f"    got      {actual}")
+                failures += not ok
+
+        if failures:
+            raise click.ClickException(f"{failures} date ranges disagree with the raw activities")
+
+    @app.cli.command('check-query-plans')
+    @click.option('--company-id', default=1, show_default=True, help='Tenant id used to bind the queries.')
+    def check_query_plans_command(company_id):
+        """Fail if any hot query plans a full table scan."""
+        from query_plans import check_query_plans
+
+        failures = 0
+        for name, plan, scans in check_query_plans(company_id):
+            status = 'FULL SCAN' if scans else 'ok'
+            click.echo(f"{name:<28} {status}")
+            for line in plan:
+                click.echo(f"    {line}")
+            failures += bool(scans)
+
+        if failures:
+            raise click.ClickException(f"{failures} hot queries degrade to a full table scan")
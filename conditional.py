@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+from flask import current_app, request, session, make_response
+
+from data_version import get_data_stamp
+from cache_backends import cache, MISSING
+
+FRAGMENT_NAMESPACE = 'fragments'
+
+
+def _templates_fingerprint(app):
+    # Rendered pages change when a deploy changes their templates, not only
+    # when the data does; hash the template sources once per process
+    fingerprint = app.extensions.get('templates_fingerprint')
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        root = os.path.join(app.root_path, app.template_folder or 'templates')
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                digest.update(os.path.relpath(path, root).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        fingerprint = digest.hexdigest()[:16]
+        app.extensions['templates_fingerprint'] = fingerprint
+    return fingerprint
+
+
+def data_etag(company_id, view, params, version):
+    """
+    Strong ETag for `view` of `company_id` at data `version` with `params`.
+    """
+    key = repr((company_id, view, params, version, _templates_fingerprint(current_app)))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _mark_revalidate(response, etag, updated_at):
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    # Per-user data: browsers may keep it but must revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _cached_fragment(etag, build):
+    # The ETag already names the exact rendering (company, params, data
+    # version, templates), so the cached body can't go stale; old versions
+    # simply age out of the cache
+    if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+        return build()
+    body = cache.get(FRAGMENT_NAMESPACE, etag)
+    if body is MISSING:
+        body = build()
+        if isinstance(body, str):
+            cache.set(FRAGMENT_NAMESPACE, etag, body)
+    return body
+
+
+def conditional_data_response(company_id, view, params, build, fragment=False):
+    """
+    Answer If-None-Match with 304 when the company's data version (and
+    `params`) are unchanged, without calling `build`. Otherwise return
+    build()'s response tagged with the ETag and Last-Modified.
+
+    With `fragment`, a rendered (string) body is also kept in the shared
+    cache, so other workers and other browsers skip rendering it.
+
+    Only If-None-Match is evaluated: Last-Modified has one-second
+    resolution, so two writes within a second would look unchanged to
+    If-Modified-Since.
+    """
+    if session.get('_flashes'):
+        # The page will show one-off messages; never pair it with an ETag
+        return make_response(build())
+
+    # Read before building, so a concurrent write can only make the tag look older
+    version, updated_at = get_data_stamp(company_id)
+    etag = data_etag(company_id, view, params, version)
+
+    if request.if_none_match.contains_weak(etag):
+        return _mark_revalidate(make_response('', 304), etag, updated_at)
+
+    body = _cached_fragment(etag, build) if fragment else build()
+    return _mark_revalidate(make_response(body), etag, updated_at)
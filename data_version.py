@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from sqlalchemy import event, select, update, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from request_memo import request_memo
+from database import replica_router, upsert
+from models import Company, Activity, EmissionTarget, CompanyDataVersion
+
+VERSIONED_MODELS = (Activity, EmissionTarget)
+
+
+def bump_data_versions(connection, company_ids):
+    """
+    Increment the data version of `company_ids` on `connection` (inside the
+    caller's transaction, so the bump commits or rolls back with the write).
+    """
+    company_ids = sorted({company_id for company_id in company_ids if company_id is not None})
+    if not company_ids:
+        return
+    # Aggregates memoized earlier in this request no longer hold
+    request_memo.clear()
+    # Pin the companies to the primary for a while once this commits
+    db.session.info.setdefault('written_companies', set()).update(company_ids)
+
+    table = CompanyDataVersion.__table__
+    now = datetime.utcnow().replace(microsecond=0)
+    rows = [{'company_id': company_id, 'version': 1, 'updated_at': now} for company_id in company_ids]
+
+    upsert(connection, table, rows, [table.c.company_id],
+           lambda excluded: {'version': table.c.version + 1, 'updated_at': excluded.updated_at})
+
+def bump_all_data_versions(connection):
+    """
+    Invalidate every company's cached views (after maintenance that rewrites derived data).
+    """
+    table = CompanyDataVersion.__table__
+    now = datetime.utcnow().replace(microsecond=0)
+    request_memo.clear()
+    connection.execute(update(table).values(version=table.c.version + 1, updated_at=now))
+
+
+def get_data_version(company_id):
+    # Always the primary: versions decide what caches may serve
+    with replica_router.primary():
+        return db.session.scalar(
+            select(CompanyDataVersion.version).where(CompanyDataVersion.company_id == company_id)
+        ) or 0
+
+
+def get_data_stamp(company_id):
+    """
+    Returns (version, updated_at) for `company_id`; (0, None) before its first write.
+    """
+    with replica_router.primary():
+        row = db.session.execute(
+            select(CompanyDataVersion.version, CompanyDataVersion.updated_at)
+            .where(CompanyDataVersion.company_id == company_id)
+        ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_versions_after_flush(session, flush_context):
+    company_ids = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, VERSIONED_MODELS):
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        # Old and new owner, in case the row moved between companies
+        history = inspect(obj).attrs.company_id.history
+        company_ids.update(history.added or ())
+        company_ids.update(history.deleted or ())
+        company_ids.update(history.unchanged or ())
+
+    # Rendered pages show the company's profile too, so edits must change their ETags
+    for obj in session.dirty:
+        if isinstance(obj, Company) and session.is_modified(obj, include_collections=False):
+            company_ids.add(obj.id)
+
+    if company_ids:
+        bump_data_versions(session.connection(), company_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def pin_writers_to_primary(session):
+    company_ids = session.info.pop('written_companies', None)
+    if company_ids:
+        replica_router.record_writes(company_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_uncommitted_writers(session):
+    session.info.pop('written_companies', None)
@@ -0,0 +1,296 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from types import SimpleNamespace
+
+from flask import g, has_request_context, session as http_session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import and_, event, insert, select, update
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URI = "sqlite:///carbon_footprint.db"
+
+
+def database_uri(url=None):
+    """
+    The SQLAlchemy URI for DATABASE_URL (SQLite in the instance folder when unset).
+    """
+    if not url:
+        return DEFAULT_DATABASE_URI
+    # Hosting platforms still hand out the scheme SQLAlchemy 1.4 dropped, and
+    # newer SQLAlchemy defaults to psycopg 3; we ship psycopg2
+    for scheme in ('postgres://', 'postgresql://'):
+        if url.startswith(scheme):
+            return 'postgresql+psycopg2://' + url[len(scheme):]
+    return url
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database: connection pool
+    sizing and health checks, and the compiled statement cache.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {'query_cache_size': config.get('DB_STATEMENT_CACHE_SIZE', 500)}
+
+    if _is_memory_sqlite(url):
+        # One connection per thread (SingletonThreadPool); nothing to size
+        return options
+
+    options.update(
+        pool_size=config.get('DB_POOL_SIZE', 5),
+        max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+        pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+        pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+        pool_pre_ping=config.get('DB_POOL_PRE_PING', True),
+    )
+    if url.get_backend_name() == 'sqlite':
+        # Seconds; the busy_timeout pragma below takes over once connected
+        options['connect_args'] = {'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000}
+    elif url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'application_name': config.get('DB_APPLICATION_NAME', 'carbontracker')}
+    return options
+
+
+def sqlite_pragmas(config):
+    """
+    (name, value) pairs run on every new SQLite connection, in order.
+    """
+    pragmas = [
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('mmap_size', config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        ('cache_size', config.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    ]
+    return [(name, value) for name, value in pragmas if value is not None]
+
+
+def engine_binds(config):
+    """
+    SQLALCHEMY_BINDS: a "replica" engine when DATABASE_REPLICA_URL is set.
+    """
+    url = config.get('DATABASE_REPLICA_URL')
+    if not url:
+        return {}
+    url = database_uri(url)
+    return {'replica': dict(engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url)), url=url)}
+
+
+def init_engine(app, db):
+    """
+    Apply per-connection settings to the app's engines. Call after
+    db.init_app(app) and before the first connection is opened.
+    """
+    with app.app_context():
+        engine = db.engine
+        engines = list(db.engines.values())
+
+    pragmas = sqlite_pragmas(app.config)
+    for bound in engines:
+        if bound.dialect.name != 'sqlite':
+            continue
+
+        @event.listens_for(bound, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas:
+                    cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+
+    app.extensions['database_engine'] = engine
+    return engine
+
+
+def upsert(connection, table, rows, key_columns, updates):
+    """
+    Insert `rows` into `table` on `connection` (inside the caller's
+    transaction). Where a row with the same `key_columns` exists, set the
+    columns returned by updates(excluded) instead; `excluded` has the new
+    row's values as attributes.
+    """
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=updates(stmt.excluded))
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        key = and_(*(column == row[column.name] for column in key_columns))
+        result = connection.execute(update(table).where(key).values(updates(SimpleNamespace(**row))))
+        if result.rowcount == 0:
+            connection.execute(insert(table), [row])
+
+
+class RoutingSession(FlaskSession):
+    """
+    Sends SELECTs to the replica engine while a request has opted in with
+    @replica_reads; flushes, DML and bare connection() calls (which the
+    write paths use) always get the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None and not self._flushing \
+                and not getattr(clause, 'is_dml', False) and replica_router.active():
+            return replica_router.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Decides per request whether reads may go to the read replica.
+
+    A company that wrote within the last `read_your_writes` seconds is
+    pinned to the primary, so it sees its own changes despite replication
+    lag. Pins are kept in the application cache (shared by every worker
+    with a shared backend) and in the writer's session cookie.
+    """
+    namespace = 'replica_pins'
+
+    def __init__(self, read_your_writes=5.0):
+        self.read_your_writes = read_your_writes
+        self.engine = None
+
+        self._lock = threading.Lock()
+        self._stats = {'replica_requests': 0, 'pinned_requests': 0, 'lagging_reads': 0}
+
+    def init_app(self, app, db):
+        self.read_your_writes = app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', self.read_your_writes)
+        with app.app_context():
+            self.engine = db.engines.get('replica')
+        app.extensions['replica_router'] = self
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def active(self):
+        return has_request_context() and g.get('_replica_reads', False)
+
+    def route_request(self, company_id):
+        """
+        Send this request's reads to the replica unless `company_id` is pinned.
+        """
+        if not self.enabled:
+            return
+        pinned = self.pinned(company_id)
+        self._count('pinned_requests' if pinned else 'replica_requests')
+        g._replica_reads = not pinned
+
+    def pinned(self, company_id):
+        from cache_backends import cache, MISSING
+
+        if http_session.get('_replica_pin_until', 0) > time.time():
+            return True
+        until = cache.get(self.namespace, company_id)
+        return until is not MISSING and until > time.time()
+
+    def record_writes(self, company_ids):
+        from cache_backends import cache
+
+        if not self.enabled or not company_ids:
+            return
+        until = time.time() + self.read_your_writes
+        for company_id in company_ids:
+            cache.set(self.namespace, company_id, until, self.read_your_writes)
+        if has_request_context():
+            http_session['_replica_pin_until'] = until
+
+    @contextmanager
+    def primary(self):
+        """
+        Send reads inside the block to the primary, whatever the request chose.
+        """
+        previous = g.get('_replica_reads', False) if has_request_context() else False
+        if previous:
+            g._replica_reads = False
+        try:
+            yield
+        finally:
+            if previous:
+                g._replica_reads = True
+
+    @contextmanager
+    def consistent_with(self, company_id, version):
+        """
+        Read from the replica inside the block only if it has already
+        replayed `version` of the company's data; otherwise from the primary.
+        """
+        if not self.active() or self._replica_version(company_id) >= version:
+            yield
+            return
+        self._count('lagging_reads')
+        with self.primary():
+            yield
+
+    def _replica_version(self, company_id):
+        from app import db
+        from models import CompanyDataVersion
+
+        return db.session.scalar(
+            select(CompanyDataVersion.version).where(CompanyDataVersion.company_id == company_id)
+        ) or 0
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(stats, enabled=self.enabled, read_your_writes=self.read_your_writes,
+                    replica_configured=self.engine is not None)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+replica_router = ReplicaRouter()
+
+
+def replica_reads(view):
+    """
+    Let a read-only view's queries go to the replica (after @login_required).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask_login import current_user
+
+        replica_router.route_request(current_user.id)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def describe_engine(engine):
+    """
+    What the engine is actually running with, for `flask check-db`.
+    """
+    pool = engine.pool
+    info = {
+        'dialect': engine.dialect.name,
+        'driver': engine.dialect.driver,
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': type(pool).__name__,
+    }
+    if hasattr(pool, 'size'):
+        info.update(pool_size=pool.size(), max_overflow=getattr(pool, '_max_overflow', None),
+                    checked_out=pool.checkedout())
+
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            info['server_version'] = conn.exec_driver_sql('SELECT sqlite_version()').scalar()
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+                info[f'pragma {name}'] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+        elif engine.dialect.name == 'postgresql':
+            info['server_version'] = conn.exec_driver_sql('SHOW server_version').scalar()
+            info['max_connections'] = conn.exec_driver_sql('SHOW max_connections').scalar()
+            info['default_transaction_isolation'] = conn.exec_driver_sql(
+                'SHOW default_transaction_isolation').scalar()
+    return info
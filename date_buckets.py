@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+from sqlalchemy import Date, and_, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def bucket_start(day, granularity):
+    """
+    First day of the bucket containing `day` (weeks start on Monday).
+    """
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return date(day.year, day.month, 1)
+    if granularity == 'quarter':
+        return date(day.year, day.month - (day.month - 1) % 3, 1)
+    if granularity == 'year':
+        return date(day.year, 1, 1)
+    raise ValueError(f"Unknown granularity {granularity!r}")
+
+
+def next_bucket(day, granularity):
+    """
+    First day of the bucket after the one containing `day`.
+    """
+    start = bucket_start(day, granularity)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month_index = start.month - 1 + months
+    return date(start.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+class date_bucket(FunctionElement):
+    """
+    date_bucket(column, granularity): the first day of the bucket holding
+    each date, as a DATE. PostgreSQL gets date_trunc, SQLite the equivalent
+    date() modifiers.
+
+    Group by it, but filter with bucket_range() on the bare column, so the
+    (company_id, date) index still narrows the rows.
+    """
+    type = Date()
+    inherit_cache = True
+    name = 'date_bucket'
+
+    def __init__(self, column, granularity):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}")
+        self.granularity = granularity
+        # As a clause (not just an attribute) so it is part of the statement cache key
+        super().__init__(column, literal_column(f"'{granularity}'"))
+
+
+@compiles(date_bucket)
+def _compile_date_bucket(element, compiler, **kw):
+    column, granularity = (compiler.process(clause, **kw) for clause in element.clauses)
+    return f"CAST(date_trunc({granularity}, {column}) AS DATE)"
+
+
+_SQLITE_BUCKETS = {
+    'day': "date({column})",
+    'week': "date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')",
+    'month': "date({column}, 'start of month')",
+    'quarter': "date({column}, 'start of month', "
+               "'-' || ((CAST(strftime('%m', {column}) AS INTEGER) - 1) % 3) || ' months')",
+    'year': "date({column}, 'start of year')",
+}
+
+
+@compiles(date_bucket, 'sqlite')
+def _compile_date_bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    return _SQLITE_BUCKETS[element.granularity].format(column=column)
+
+
+def bucket_range(column, granularity, from_date=None, to_date=None):
+    """
+    Half-open range predicate on `column` covering every bucket that
+    overlaps [from_date, to_date]; either end may be None.
+    """
+    clauses = []
+    if from_date is not None:
+        clauses.append(column >= bucket_start(from_date, granularity))
+    if to_date is not None:
+        clauses.append(column < next_bucket(to_date, granularity))
+    return and_(True, *clauses)
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from app import db
+from models import Activity
+
+EXPORT_COLUMNS = (
+    Activity.id,
+    Activity.date,
+    Activity.title,
+    Activity.category,
+    Activity.description,
+    Activity.emission_value,
+    Activity.emission_unit,
+    Activity.emission_kg,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+# Rows fetched from the cursor (and bytes sent) per chunk
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_activity_rows(clauses, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream matching activities as plain rows, newest first, without
+    materializing the result set (server-side cursor where supported).
+    """
+    statement = select(*EXPORT_COLUMNS).where(*clauses)\
+        .order_by(Activity.date.desc(), Activity.id.desc())\
+        .execution_options(yield_per=batch_size)
+
+    result = db.session.execute(statement)
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def iter_csv(clauses, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+
+    for rows in iter_activity_rows(clauses, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (row.id, row.date.isoformat(), row.title, row.category, row.description,
+             row.emission_value, row.emission_unit, row.emission_kg)
+            for row in rows
+        )
+        yield buffer.getvalue()
+
+
+def iter_ndjson(clauses, batch_size=EXPORT_BATCH_SIZE):
+    for rows in iter_activity_rows(clauses, batch_size):
+        lines = []
+        for row in rows:
+            record = row._asdict()
+            record['date'] = row.date.isoformat()
+            lines.append(json.dumps(record))
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+}
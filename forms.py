@@ -1,9 +1,25 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField, FloatField, DateField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField, FloatField, DateField, HiddenField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError
 from models import Company
 from datetime import date
 
+ACTIVITY_CATEGORY_CHOICES = [
+    ('energy', 'Energy Consumption'),
+    ('transportation', 'Transportation'),
+    ('manufacturing', 'Manufacturing Process'),
+    ('business_travel', 'Business Travel'),
+    ('waste', 'Waste Management'),
+    ('water', 'Water Usage'),
+    ('other', 'Other')
+]
+
+EMISSION_UNIT_CHOICES = [
+    ('kg', 'Kilograms (kg CO2e)'),
+    ('tonnes', 'Tonnes (t CO2e)')
+]
+
 class RegistrationForm(FlaskForm):
     name = StringField('Company Name', validators=[DataRequired(), Length(min=2, max=100)])
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -42,40 +58,32 @@ class LoginForm(FlaskForm):
 
 class ActivityForm(FlaskForm):
     title = StringField('Activity Title', validators=[DataRequired(), Length(max=100)])
-    category = SelectField('Category', choices=[
-        ('', 'Select Category'),
-        ('energy', 'Energy Consumption'),
-        ('transportation', 'Transportation'),
-        ('manufacturing', 'Manufacturing Process'),
-        ('business_travel', 'Business Travel'),
-        ('waste', 'Waste Management'),
-        ('water', 'Water Usage'),
-        ('other', 'Other')
-    ], validators=[DataRequired()])
+    category = SelectField('Category', choices=[('', 'Select Category')] + ACTIVITY_CATEGORY_CHOICES,
+                           validators=[DataRequired()])
     description = TextAreaField('Description', validators=[Length(max=500)])
     date = DateField('Date', validators=[DataRequired()], default=date.today)
     emission_value = FloatField('Emission Value', validators=[DataRequired()])
-    emission_unit = SelectField('Unit', choices=[
-        ('kg', 'Kilograms (kg CO2e)'),
-        ('tonnes', 'Tonnes (t CO2e)')
-    ], default='kg')
+    emission_unit = SelectField('Unit', choices=EMISSION_UNIT_CHOICES, default='kg')
     submit = SubmitField('Submit Activity')
 
 class EmissionTargetForm(FlaskForm):
     target_value = FloatField('Target Emission Value', validators=[DataRequired()])
-    target_unit = SelectField('Unit', choices=[
-        ('kg', 'Kilograms (kg CO2e)'),
-        ('tonnes', 'Tonnes (t CO2e)')
-    ], default='kg')
+    target_unit = SelectField('Unit', choices=EMISSION_UNIT_CHOICES, default='kg')
     target_date = DateField('Target Date', validators=[DataRequired()])
-    category = SelectField('Category (Optional)', choices=[
-        ('overall', 'Overall Emissions'),
-        ('energy', 'Energy Consumption'),
-        ('transportation', 'Transportation'),
-        ('manufacturing', 'Manufacturing Process'),
-        ('business_travel', 'Business Travel'),
-        ('waste', 'Waste Management'),
-        ('water', 'Water Usage'),
-        ('other', 'Other')
-    ], default='overall')
+    category = SelectField('Category (Optional)', choices=[('overall', 'Overall Emissions')] + ACTIVITY_CATEGORY_CHOICES,
+                           default='overall')
     submit = SubmitField('Set Target')
+
+class ActivityImportForm(FlaskForm):
+    file = FileField('CSV File', validators=[FileRequired(), FileAllowed(['csv'], 'Please upload a .csv file')])
+    submit = SubmitField('Import Activities')
+
+class BulkActionForm(FlaskForm):
+    # The activities page filters the bulk action applies to
+    category = HiddenField()
+    from_date = HiddenField()
+    to_date = HiddenField()
+    action = SelectField('Action', choices=[('recategorize', 'Move to category'), ('delete', 'Delete')])
+    new_category = SelectField('New Category', choices=ACTIVITY_CATEGORY_CHOICES)
+    dry_run = SubmitField('Preview Count')
+    submit = SubmitField('Apply')
@@ -0,0 +1,21 @@
+"""
+gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    flask --app app init-db
+    gunicorn --bind 0.0.0.0:5000 main:app
+
+The master imports the app once (preload_app) and forks the workers, which
+then share the imported code copy-on-write instead of each importing it.
+"""
+import os
+import sys
+
+# The reloader needs every worker to import the app itself
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes") and "--reload" not in sys.argv
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must never be shared with a worker
+    if server.cfg.preload_app:
+        from app import dispose_engines
+        dispose_engines(server.app.wsgi())
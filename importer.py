@@ -0,0 +1,196 @@
+import csv
+import io
+import math
+import time
+from datetime import date
+from itertools import islice
+
+from sqlalchemy import insert
+
+from app import db
+from forms import ACTIVITY_CATEGORY_CHOICES
+from models import Activity, UNIT_TO_KG
+from rollups import RollupDeltas, apply_rollup_deltas
+from data_version import bump_data_versions
+
+VALID_CATEGORIES = frozenset(value for value, _ in ACTIVITY_CATEGORY_CHOICES)
+VALID_UNITS = frozenset(UNIT_TO_KG)
+
+REQUIRED_COLUMNS = ('title', 'category', 'date', 'emission_value')
+# Anything else in the header (e.g. id / emission_kg from an export) is ignored
+OPTIONAL_COLUMNS = ('description', 'emission_unit')
+
+IMPORT_BATCH_SIZE = 1000
+# Per-row errors kept in the result; the error count is always exact
+MAX_REPORTED_ERRORS = 200
+
+TITLE_MAX_LENGTH = 100
+DESCRIPTION_MAX_LENGTH = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _parse_value(value):
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) and number >= 0 else None
+
+
+def validate_batch(columns, count):
+    """
+    Validate one batch column by column.
+
+    `columns` maps column name -> list of `count` stripped strings. Returns
+    (valid row dicts ready for insert_activity_rows, {row index: message}).
+    """
+    errors = {}
+
+    def reject(check, values, message):
+        for index, value in enumerate(values):
+            if index not in errors and not check(value):
+                errors[index] = message(value)
+
+    titles = columns['title']
+    reject(lambda v: v and len(v) <= TITLE_MAX_LENGTH, titles,
+           lambda v: 'title is required' if not v else f"title is longer than {TITLE_MAX_LENGTH} characters")
+
+    categories = [value.lower() for value in columns['category']]
+    reject(VALID_CATEGORIES.__contains__, categories,
+           lambda v: f"unknown category '{v}'")
+
+    dates = [_parse_date(value) for value in columns['date']]
+    reject(lambda v: v is not None, dates, lambda v: 'date must be YYYY-MM-DD')
+
+    values = [_parse_value(value) for value in columns['emission_value']]
+    reject(lambda v: v is not None, values, lambda v: 'emission_value must be a non-negative number')
+
+    units = [value.lower() or 'kg' for value in columns.get('emission_unit') or [''] * count]
+    reject(VALID_UNITS.__contains__, units,
+           lambda v: f"unknown unit '{v}' (expected {', '.join(sorted(VALID_UNITS))})")
+
+    descriptions = columns.get('description') or [''] * count
+    reject(lambda v: len(v) <= DESCRIPTION_MAX_LENGTH, descriptions,
+           lambda v: f"description is longer than {DESCRIPTION_MAX_LENGTH} characters")
+
+    rows = [
+        {
+            'title': titles[i],
+            'category': categories[i],
+            'description': descriptions[i],
+            'date': dates[i],
+            'emission_value': values[i],
+            'emission_unit': units[i],
+            'emission_kg': values[i] * UNIT_TO_KG[units[i]],
+        }
+        for i in range(count) if i not in errors
+    ]
+    return rows, errors
+
+
+def insert_activity_rows(company_id, rows):
+    """
+    Insert many activities with a single executemany and keep the monthly
+    rollups in step, inside the caller's transaction (the caller commits).
+    Returns the new activity ids in the order of `rows`.
+
+    Core inserts skip the ORM flush hooks, so `emission_kg` must already be
+    set on every row and the rollup deltas are applied here instead.
+    """
+    if not rows:
+        return []
+
+    deltas = RollupDeltas()
+    for row in rows:
+        row['company_id'] = company_id
+        deltas.add(company_id, row['date'], row['category'], row['emission_kg'])
+
+    ids = db.session.execute(
+        insert(Activity).returning(Activity.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    apply_rollup_deltas(db.session.connection(), deltas)
+    bump_data_versions(db.session.connection(), [company_id])
+    return ids
+
+
+def import_activities_csv(stream, company_id, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stream a CSV of activities into `company_id`, validating and inserting
+    `batch_size` rows per transaction. Invalid rows are reported and
+    skipped; a batch that fails to insert is rolled back on its own.
+
+    `stream` may be a binary file object (e.g. an upload) or a text one.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(stream)
+
+    header = [name.strip().lower() for name in next(reader, [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        result.add_error(1, f"missing required column(s): {', '.join(missing)}")
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    positions = {name: header.index(name) for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if name in header}
+    width = len(header)
+
+    def numbered_records():
+        # line_num is the CSV line each record ends on; blank lines are skipped
+        for record in reader:
+            if any(field.strip() for field in record):
+                yield reader.line_num, record
+
+    records_iter = numbered_records()
+    while True:
+        batch = list(islice(records_iter, batch_size))
+        if not batch:
+            break
+        result.rows_read += len(batch)
+
+        lines = [line for line, _ in batch]
+        records = [record + [''] * (width - len(record)) for _, record in batch]
+
+        columns = {name: [record[position].strip() for record in records]
+                   for name, position in positions.items()}
+        rows, errors = validate_batch(columns, len(records))
+
+        for index in sorted(errors):
+            result.add_error(lines[index], errors[index])
+
+        try:
+            result.inserted += len(insert_activity_rows(company_id, rows))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            result.add_error(lines[0], f"batch of {len(rows)} rows failed to insert: {e}")
+
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,130 @@
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from importer import validate_batch, insert_activity_rows, REQUIRED_COLUMNS, OPTIONAL_COLUMNS
+from models import Activity, IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+
+class IngestValidationError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid activities")
+        self.errors = errors
+
+
+def _as_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def validate_items(items):
+    """
+    Validate a list of JSON activity objects with the same columnar checks as
+    the CSV import. Returns (rows, idempotency keys); raises
+    IngestValidationError listing every bad item by index.
+    """
+    errors = {}
+    objects = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = 'activity must be a JSON object'
+            item = {}
+        for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS:
+            value = item.get(name)
+            if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+                errors.setdefault(index, f"{name} must be a string or number")
+        objects.append(item)
+
+    columns = {
+        name: [_as_text(item.get(name)) for item in objects]
+        for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+    }
+    rows, row_errors = validate_batch(columns, len(objects))
+    for index, message in row_errors.items():
+        errors.setdefault(index, message)
+
+    keys = []
+    seen = set()
+    for index, item in enumerate(objects):
+        key = item.get('idempotency_key')
+        if key is not None:
+            if not isinstance(key, str) or not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                errors.setdefault(index, f"idempotency_key must be a string of 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+            elif key in seen:
+                errors.setdefault(index, 'idempotency_key is repeated within the batch')
+            else:
+                seen.add(key)
+        keys.append(key)
+
+    if errors:
+        raise IngestValidationError([
+            {'index': index, 'error': errors[index]} for index in sorted(errors)
+        ])
+    return rows, keys
+
+
+def store_activities(company_id, rows, keys):
+    """
+    Insert validated rows and their idempotency keys in the current
+    transaction (the caller commits). Keys already stored, including ones
+    written earlier in the same transaction, are reported as duplicates.
+    """
+    keyed = [key for key in keys if key is not None]
+    existing = {}
+    if keyed:
+        rows_by_key = db.session.execute(
+            select(IdempotencyKey.key, IdempotencyKey.activity_id, Activity.id)
+            .outerjoin(Activity, Activity.id == IdempotencyKey.activity_id)
+            .where(IdempotencyKey.company_id == company_id, IdempotencyKey.key.in_(keyed))
+        ).all()
+        existing = {key: activity_id for key, activity_id, live_id in rows_by_key if live_id is not None}
+        # A key whose activity has since been deleted is free again
+        orphaned = [key for key, _, live_id in rows_by_key if live_id is None]
+        if orphaned:
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.company_id == company_id, IdempotencyKey.key.in_(orphaned))
+            )
+
+    new_positions = [i for i, key in enumerate(keys) if key not in existing]
+    ids = insert_activity_rows(company_id, [rows[i] for i in new_positions])
+
+    created = dict(zip(new_positions, ids))
+    key_rows = [
+        {'company_id': company_id, 'key': keys[i], 'activity_id': activity_id}
+        for i, activity_id in created.items() if keys[i] is not None
+    ]
+    if key_rows:
+        db.session.execute(insert(IdempotencyKey), key_rows)
+
+    results = []
+    for index, key in enumerate(keys):
+        if index in created:
+            results.append({'index': index, 'id': created[index], 'status': 'created'})
+        else:
+            results.append({'index': index, 'id': existing[key], 'status': 'duplicate'})
+    return results
+
+
+def ingest_activities(company_id, items):
+    """
+    Insert a batch of JSON activities for `company_id` in one transaction.
+
+    Items carrying an `idempotency_key` that was already ingested are not
+    inserted again; their result points at the original activity. Returns
+    one {'index', 'id', 'status'} dict per item.
+    """
+    rows, keys = validate_items(items)
+
+    # A concurrent retry of the same batch can win the race on the key
+    # table; roll back and resolve against what it committed.
+    for attempt in range(2):
+        try:
+            results = store_activities(company_id, [dict(row) for row in rows], keys)
+            db.session.commit()
+            return results
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
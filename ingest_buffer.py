@@ -0,0 +1,279 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from ingest import store_activities
+
+
+class IngestBufferError(Exception):
+    pass
+
+
+class IngestBufferFull(IngestBufferError):
+    pass
+
+
+class Submission:
+    """
+    One caller's batch waiting in the buffer. `wait()` blocks until the flush
+    that contains it has committed (or failed).
+    """
+
+    def __init__(self, company_id, rows, keys):
+        self.company_id = company_id
+        self.rows = rows
+        self.keys = keys
+        self.queued_at = time.monotonic()
+        self.results = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, results=None, error=None):
+        self.results = results
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise IngestBufferError('Timed out waiting for the ingest buffer to flush')
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for activity inserts. Submissions from all request
+    threads of a process are queued and written by one background thread,
+    many per transaction, once `max_rows` rows are waiting or the oldest has
+    waited `max_delay` seconds. With SQLite this turns many competing
+    one-row commits into a few larger ones, so workers stop fighting over
+    the database write lock.
+
+    When `capacity` rows are already queued, submit() waits up to
+    `put_timeout` seconds for room and then raises IngestBufferFull.
+    """
+
+    def __init__(self, writer=store_activities, max_rows=500, max_delay=0.01, capacity=10000,
+                 put_timeout=2.0, wait_timeout=30.0):
+        self.writer = writer
+        self.enabled = False
+        self.durability = 'sync'
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self.put_timeout = put_timeout
+        self.wait_timeout = wait_timeout
+        self.app = None
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued_rows = 0
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            'submissions': 0,
+            'rows_submitted': 0,
+            'rejected': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'failed_submissions': 0,
+            'last_flush_rows': 0,
+            'last_flush_seconds': None,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('INGEST_BUFFER_ENABLED', self.enabled)
+        self.durability = app.config.get('INGEST_BUFFER_DURABILITY', self.durability)
+        self.max_rows = app.config.get('INGEST_BUFFER_MAX_ROWS', self.max_rows)
+        self.max_delay = app.config.get('INGEST_BUFFER_MAX_DELAY', self.max_delay)
+        self.capacity = app.config.get('INGEST_BUFFER_CAPACITY', self.capacity)
+        self.put_timeout = app.config.get('INGEST_BUFFER_PUT_TIMEOUT', self.put_timeout)
+        app.extensions['ingest_buffer'] = self
+        # Write out whatever is still queued when the worker process exits
+        atexit.register(self.stop)
+
+    @property
+    def wait_for_flush(self):
+        return self.durability == 'sync'
+
+    def submit(self, company_id, rows, keys=None):
+        """
+        Queue validated rows (as produced by importer.validate_batch) for
+        `company_id`. Returns a Submission; call wait() on it for the results.
+        """
+        keys = keys if keys is not None else [None] * len(rows)
+        submission = Submission(company_id, rows, keys)
+        self.start()
+
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            # A batch bigger than the whole buffer is let in once the queue drains
+            while self._queued_rows and self._queued_rows + len(rows) > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['rejected'] += 1
+                    raise IngestBufferFull(f"Ingest buffer is full ({self._queued_rows} rows queued)")
+                self._cond.wait(remaining)
+
+            self._queue.append(submission)
+            self._queued_rows += len(rows)
+            self._stats['submissions'] += 1
+            self._stats['rows_submitted'] += len(rows)
+            self._cond.notify_all()
+        return submission
+
+    def start(self):
+        """
+        Start the flush thread for this process (safe to call repeatedly and after fork).
+        """
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Anything queued before a fork belongs to the parent
+                self._queue.clear()
+                self._queued_rows = 0
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='ingest-flush', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Flush everything still queued and stop the flush thread.
+        """
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._cond:
+            oldest = self._queue[0].queued_at if self._queue else None
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                durability=self.durability,
+                queued_rows=self._queued_rows,
+                queued_submissions=len(self._queue),
+                oldest_wait_seconds=round(time.monotonic() - oldest, 3) if oldest is not None else None,
+                max_rows=self.max_rows,
+                max_delay=self.max_delay,
+                capacity=self.capacity,
+            )
+
+    def _take_batch(self):
+        # Wait until a flush is due, then dequeue up to max_rows rows of submissions
+        with self._cond:
+            while True:
+                if self._queue:
+                    due = self._queue[0].queued_at + self.max_delay
+                    remaining = due - time.monotonic()
+                    if self._queued_rows >= self.max_rows or remaining <= 0 or self._stopping:
+                        break
+                    self._cond.wait(remaining)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+            batch = [self._queue.popleft()]
+            rows = len(batch[0].rows)
+            while self._queue and rows + len(self._queue[0].rows) <= self.max_rows:
+                submission = self._queue.popleft()
+                batch.append(submission)
+                rows += len(submission.rows)
+            self._queued_rows -= rows
+            # Wake submitters waiting for room
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            with self.app.app_context():
+                self._flush(batch)
+
+    def _write(self, batch):
+        # One writer call per company, unless the same idempotency key was
+        # submitted twice; then go one submission at a time so the second
+        # sees the first as a duplicate.
+        groups = {}
+        for submission in batch:
+            groups.setdefault(submission.company_id, []).append(submission)
+
+        results = {}
+        for company_id, group in groups.items():
+            keys = [key for s in group for key in s.keys]
+            named = [key for key in keys if key is not None]
+            if len(group) > 1 and len(named) != len(set(named)):
+                for submission in group:
+                    results[id(submission)] = self.writer(
+                        company_id, [dict(row) for row in submission.rows], submission.keys)
+                continue
+
+            rows = [dict(row) for s in group for row in s.rows]
+            merged = self.writer(company_id, rows, keys)
+            offset = 0
+            for submission in group:
+                part = merged[offset:offset + len(submission.rows)]
+                results[id(submission)] = [dict(result, index=result['index'] - offset) for result in part]
+                offset += len(submission.rows)
+
+        return [results[id(submission)] for submission in batch]
+
+    def _flush(self, batch, retry=True):
+        started = time.monotonic()
+        try:
+            results = self._write(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) > 1:
+                # Keep one bad submission from failing the others
+                for submission in batch:
+                    self._flush([submission])
+                return
+            if retry and isinstance(e, IntegrityError):
+                # Another process committed one of its idempotency keys first;
+                # write it again so the key resolves as a duplicate (as ingest_activities does)
+                self._flush(batch, retry=False)
+                return
+            logging.error(f"Ingest buffer flush failed: {str(e)}")
+            with self._cond:
+                self._stats['failed_submissions'] += 1
+            # Surfaced like backpressure, so callers answer 503 rather than 500
+            error = IngestBufferError("Could not write the activities right now; please retry")
+            error.__cause__ = e
+            batch[0].finish(error=error)
+            return
+        finally:
+            db.session.remove()
+
+        rows = sum(len(s.rows) for s in batch)
+        with self._cond:
+            self._stats['flushes'] += 1
+            self._stats['rows_flushed'] += rows
+            self._stats['last_flush_rows'] = rows
+            self._stats['last_flush_seconds'] = round(time.monotonic() - started, 4)
+        for submission, result in zip(batch, results):
+            submission.finish(results=result)
+
+
+ingest_buffer = IngestBuffer()
@@ -1,12 +1,17 @@
 from datetime import datetime
-from app import db, login_manager
+from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from sqlalchemy import func, event
+from request_memo import request_memo
 
-@login_manager.user_loader
-def load_user(user_id):
-    return Company.query.get(int(user_id))
+# Conversion factors to the canonical unit (kg CO2e)
+UNIT_TO_KG = {'kg': 1.0, 'tonnes': 1000.0}
+
+def to_kg(value, unit):
+    if value is None:
+        return None
+    return value * UNIT_TO_KG.get(unit or 'kg', 1.0)
 
 class Company(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,13 +31,30 @@ class Company(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def get_total_emissions(self):
-        return db.session.query(func.sum(Activity.emission_value)).filter_by(company_id=self.id).scalar() or 0
+        return company_total_emissions(self.id)
     
     def get_emissions_by_category(self):
-        return db.session.query(
-            Activity.category, 
-            func.sum(Activity.emission_value).label('total')
-        ).filter_by(company_id=self.id).group_by(Activity.category).all()
+        return company_emissions_by_category(self.id)
+
+# Both read the monthly rollup table instead of scanning activities, at
+# most once per request each; shared by Company and the cached principal
+def company_total_emissions(company_id):
+    by_category = request_memo.peek('emissions_by_category', company_id)
+    if by_category is not None:
+        return sum(total for _, total in by_category) or 0
+    return request_memo.get_or_compute(
+        'total_emissions', company_id,
+        lambda: db.session.query(func.sum(ActivityRollup.total)).filter_by(company_id=company_id).scalar() or 0
+    )
+
+def company_emissions_by_category(company_id):
+    return request_memo.get_or_compute(
+        'emissions_by_category', company_id,
+        lambda: db.session.query(
+            ActivityRollup.category, 
+            func.sum(ActivityRollup.total).label('total')
+        ).filter_by(company_id=company_id).group_by(ActivityRollup.category).all()
+    )
 
 class Activity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,14 +64,83 @@ class Activity(db.Model):
     date = db.Column(db.Date, nullable=False)
     emission_value = db.Column(db.Float, nullable=False)  # In CO2e (Carbon dioxide equivalent)
     emission_unit = db.Column(db.String(20), default='kg', nullable=False)  # kg, tonnes
+    emission_kg = db.Column(db.Float)  # emission_value converted to kg, used by every aggregate
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Every tenant query filters on company_id first, then sorts/groups by one of these
+    __table_args__ = (
+        db.Index('ix_activity_company_date', 'company_id', 'date'),
+        db.Index('ix_activity_company_category_date', 'company_id', 'category', 'date'),
+        db.Index('ix_activity_company_emission_kg', 'company_id', 'emission_kg'),
+    )
+
 class EmissionTarget(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     target_value = db.Column(db.Float, nullable=False)  # Target emission value in CO2e
     target_unit = db.Column(db.String(20), default='kg', nullable=False)  # kg, tonnes
+    target_kg = db.Column(db.Float)  # target_value converted to kg
     target_date = db.Column(db.Date, nullable=False)
     category = db.Column(db.String(50))  # If for a specific category, otherwise overall
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_emission_target_company_category_date', 'company_id', 'category', 'target_date'),
+    )
+
+class ActivityRollup(db.Model):
+    """
+    Per company, month and category totals of Activity.emission_kg.
+    Maintained on every flush (see rollups.py) so aggregates don't scan activities.
+    """
+    __tablename__ = 'activity_monthly_rollup'
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # First day of the month
+    category = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CompanyDataVersion(db.Model):
+    """
+    Counter bumped in the same transaction as every write to a company's
+    activities or targets (see data_version.py); cached views are keyed on it.
+    """
+    __tablename__ = 'company_data_version'
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)  # Time of the last bump, used as Last-Modified
+
+class ApiKey(db.Model):
+    """
+    Machine credentials for the JSON API. Only the SHA-256 of the key is stored.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revoked_at = db.Column(db.DateTime)
+
+class IdempotencyKey(db.Model):
+    """
+    Client-supplied key of an ingested activity, so a retried batch does not insert it twice.
+    """
+    __tablename__ = 'activity_idempotency_key'
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id', ondelete='CASCADE'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+@event.listens_for(Activity, 'before_insert')
+@event.listens_for(Activity, 'before_update')
+def set_emission_kg(mapper, connection, activity):
+    activity.emission_kg = to_kg(activity.emission_value, activity.emission_unit)
+
+@event.listens_for(EmissionTarget, 'before_insert')
+@event.listens_for(EmissionTarget, 'before_update')
+def set_target_kg(mapper, connection, target):
+    target.target_kg = to_kg(target.target_value, target.target_unit)
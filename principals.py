@@ -0,0 +1,127 @@
+from functools import wraps
+
+from flask import abort, current_app
+from flask_login import UserMixin, current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db, login_manager
+from models import Company, company_total_emissions, company_emissions_by_category
+from cache_backends import cache, MISSING
+
+PRINCIPAL_FIELDS = ('id', 'name', 'industry', 'size')
+
+
+class CompanyPrincipal(UserMixin):
+    """
+    What current_user is on authenticated requests: the few Company fields
+    pages display, without an ORM instance (or its lazy relationships).
+    Use load_company() where the full row is needed.
+    """
+
+    def __init__(self, id, name, industry=None, size=None):
+        self.id = id
+        self.name = name
+        self.industry = industry
+        self.size = size
+
+    def get_total_emissions(self):
+        return company_total_emissions(self.id)
+
+    def get_emissions_by_category(self):
+        return company_emissions_by_category(self.id)
+
+    def load_company(self):
+        return db.session.get(Company, self.id)
+
+    def __repr__(self):
+        return f"<CompanyPrincipal {self.id}>"
+
+
+class PrincipalCache:
+    """
+    Caches the principal of each logged-in company in the application cache
+    for `ttl` seconds, so requests don't start with a Company lookup.
+
+    Entries are dropped when a commit changes or deletes the company. With
+    the per-process memory backend only the committing worker sees that; the
+    others catch up within `ttl`.
+    """
+    namespace = 'principals'
+
+    def __init__(self, store=cache, ttl=60, enabled=True):
+        self.store = store
+        self.ttl = ttl
+        self.enabled = enabled
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+        self.enabled = app.config.get('PRINCIPAL_CACHE_ENABLED', self.enabled)
+        app.extensions['principal_cache'] = self
+
+    def load(self, company_id):
+        if self.enabled:
+            fields = self.store.get(self.namespace, company_id)
+            if fields is not MISSING:
+                return CompanyPrincipal(**fields)
+
+        row = db.session.execute(
+            select(*(getattr(Company, field) for field in PRINCIPAL_FIELDS)).where(Company.id == company_id)
+        ).first()
+        if row is None:
+            return None
+        fields = dict(row._mapping)
+        if self.enabled:
+            self.store.set(self.namespace, company_id, fields, self.ttl)
+        return CompanyPrincipal(**fields)
+
+    def invalidate(self, company_ids):
+        for company_id in company_ids:
+            self.store.delete(self.namespace, company_id)
+
+
+principal_cache = PrincipalCache()
+
+
+def operator_required(view):
+    """
+    Limit a view (after @login_required) to the companies in OPERATOR_EMAILS;
+    others get a 404.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        operators = current_app.config.get('OPERATOR_EMAILS') or ()
+        company = db.session.get(Company, current_user.id) if operators else None
+        if company is None or company.email.lower() not in operators:
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return principal_cache.load(int(user_id))
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_principals(session, flush_context):
+    changed = session.info.setdefault('changed_principals', set())
+    for obj in session.deleted:
+        if isinstance(obj, Company):
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Company) and session.is_modified(obj, include_collections=False):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_principals(session):
+    # After the commit, so a concurrent request can't re-cache the old row
+    changed = session.info.pop('changed_principals', None)
+    if changed:
+        principal_cache.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_principals(session):
+    session.info.pop('changed_principals', None)
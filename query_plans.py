@@ -0,0 +1,135 @@
+import re
+from datetime import date
+
+from sqlalchemy import select, func, tuple_
+
+from app import db
+from models import Activity, EmissionTarget, ActivityRollup, ApiKey, IdempotencyKey
+from date_buckets import date_bucket, bucket_range
+
+# Tables that must always be reached through an index
+TENANT_TABLES = ('activity', 'emission_target', 'activity_monthly_rollup', 'api_key', 'activity_idempotency_key')
+
+# SQLite reports index lookups as SEARCH; SCAN walks the whole table (or a whole index)
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)\b')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def hot_queries(company_id=1):
+    """
+    The queries behind the dashboard, activities, targets, reports, chart
+    and ingest endpoints, with representative parameters.
+    """
+    from_date = date(2024, 1, 1)
+    to_date = date(2024, 12, 31)
+
+    return [
+        ('total_emissions',
+         select(func.sum(ActivityRollup.total)).where(ActivityRollup.company_id == company_id)),
+        ('emissions_by_category',
+         select(ActivityRollup.category, func.sum(ActivityRollup.total))
+         .where(ActivityRollup.company_id == company_id)
+         .group_by(ActivityRollup.category)),
+        ('recent_activities',
+         select(Activity).where(Activity.company_id == company_id)
+         .order_by(Activity.date.desc()).limit(5)),
+        ('overall_target',
+         select(EmissionTarget)
+         .where(EmissionTarget.company_id == company_id, EmissionTarget.category == 'overall')
+         .order_by(EmissionTarget.target_date.desc()).limit(1)),
+        ('monthly_trend',
+         select(ActivityRollup.month, func.sum(ActivityRollup.total))
+         .where(ActivityRollup.company_id == company_id)
+         .group_by(ActivityRollup.month).order_by(ActivityRollup.month)),
+        ('weekly_trend',
+         select(date_bucket(Activity.date, 'week'), func.sum(Activity.emission_kg))
+         .where(Activity.company_id == company_id, bucket_range(Activity.date, 'week', from_date, to_date))
+         .group_by(date_bucket(Activity.date, 'week'))),
+        ('quarterly_trend',
+         select(date_bucket(ActivityRollup.month, 'quarter'), func.sum(ActivityRollup.total))
+         .where(ActivityRollup.company_id == company_id,
+                bucket_range(ActivityRollup.month, 'quarter', from_date, to_date))
+         .group_by(date_bucket(ActivityRollup.month, 'quarter'))),
+        ('stats_full_months',
+         select(ActivityRollup.month, ActivityRollup.category, ActivityRollup.total)
+         .where(ActivityRollup.company_id == company_id,
+                ActivityRollup.month >= from_date, ActivityRollup.month < to_date)),
+        ('stats_edge_month',
+         select(Activity.category, func.sum(Activity.emission_kg))
+         .where(Activity.company_id == company_id, Activity.date >= from_date, Activity.date <= to_date)
+         .group_by(Activity.category)),
+        ('activities_list',
+         select(Activity).where(Activity.company_id == company_id)
+         .order_by(Activity.date.desc())),
+        ('activities_list_filtered',
+         select(Activity)
+         .where(Activity.company_id == company_id, Activity.category == 'energy',
+                Activity.date >= from_date, Activity.date <= to_date)
+         .order_by(Activity.date.desc())),
+        ('activities_keyset_page',
+         select(Activity.id, Activity.title, Activity.date)
+         .where(Activity.company_id == company_id,
+                tuple_(Activity.date, Activity.id) < tuple_(to_date, 1000))
+         .order_by(Activity.date.desc(), Activity.id.desc()).limit(51)),
+        ('activities_keyset_page_filtered',
+         select(Activity.id, Activity.title, Activity.date)
+         .where(Activity.company_id == company_id, Activity.category == 'energy',
+                tuple_(Activity.date, Activity.id) < tuple_(to_date, 1000))
+         .order_by(Activity.date.desc(), Activity.id.desc()).limit(51)),
+        ('activity_categories',
+         select(Activity.category).where(Activity.company_id == company_id).distinct()),
+        ('targets_list',
+         select(EmissionTarget).where(EmissionTarget.company_id == company_id)
+         .order_by(EmissionTarget.category, EmissionTarget.target_date)),
+        ('highest_emissions',
+         select(Activity).where(Activity.company_id == company_id)
+         .order_by(Activity.emission_kg.desc()).limit(5)),
+        ('api_key_lookup',
+         select(ApiKey.company_id).where(ApiKey.key_hash == '0' * 64, ApiKey.revoked_at.is_(None))),
+        ('idempotency_keys',
+         select(IdempotencyKey.key, IdempotencyKey.activity_id)
+         .where(IdempotencyKey.company_id == company_id, IdempotencyKey.key.in_(['a', 'b']))),
+    ]
+
+
+def explain(statement):
+    """
+    Returns the plan lines for `statement` on the current engine.
+    """
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={'render_postcompile': True})
+
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            params = compiled.construct_params()
+            positional = tuple(params[name] for name in compiled.positiontup)
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional).all()
+            return [row[-1] for row in rows]
+
+        # Small tables always favour a sequential scan; only report one if no index could be used
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        rows = conn.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params).all()
+        conn.rollback()
+        return [row[0] for row in rows]
+
+
+def full_scans(plan, dialect_name):
+    pattern = SQLITE_FULL_SCAN if dialect_name == 'sqlite' else POSTGRES_FULL_SCAN
+    scans = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match and match.group(1) in TENANT_TABLES:
+            scans.append(line.strip())
+    return scans
+
+
+def check_query_plans(company_id=1):
+    """
+    Explain every hot query. Returns a list of (name, plan, full_scans).
+    """
+    dialect_name = db.engine.dialect.name
+    results = []
+    for name, statement in hot_queries(company_id):
+        plan = explain(statement)
+        results.append((name, plan, full_scans(plan, dialect_name)))
+    return results
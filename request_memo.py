@@ -0,0 +1,76 @@
+import logging
+
+from flask import g, has_request_context
+
+
+class RequestMemo:
+    """
+    Memoizes expensive lookups for the rest of the current request, so
+    pages and templates can call them as often as they like.
+
+    Each computation is counted per request; with REQUEST_MEMO_DEBUG the
+    counts go out in an X-Memo-Computations header, and any name computed
+    more than once for the same key is logged. Writes to a company's data
+    (see data_version) forget what was memoized for the request.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+
+    def init_app(self, app):
+        self.debug = app.config.get('REQUEST_MEMO_DEBUG', self.debug)
+        app.after_request(self._report)
+        app.extensions['request_memo'] = self
+
+    def get_or_compute(self, name, key, compute):
+        if not has_request_context():
+            return compute()
+
+        values = g.setdefault('_memo_values', {})
+        if (name, key) in values:
+            return values[(name, key)]
+
+        value = values[(name, key)] = compute()
+        counts = g.setdefault('_memo_counts', {})
+        counts[(name, key)] = counts.get((name, key), 0) + 1
+        return value
+
+    def peek(self, name, key, default=None):
+        """
+        The value memoized for (name, key) in this request, without computing it.
+        """
+        if not has_request_context():
+            return default
+        return g.get('_memo_values', {}).get((name, key), default)
+
+    def clear(self):
+        # Counts restart too: computing again after a write is expected
+        if has_request_context():
+            g.pop('_memo_values', None)
+            g.pop('_memo_counts', None)
+
+    def computations(self):
+        """
+        How many times each name was computed in this request (summed over
+        keys), since its last write.
+        """
+        totals = {}
+        if has_request_context():
+            for (name, _), count in g.get('_memo_counts', {}).items():
+                totals[name] = totals.get(name, 0) + count
+        return totals
+
+    def _report(self, response):
+        if not self.debug:
+            return response
+        counts = g.get('_memo_counts', {})
+        repeated = {key: count for key, count in counts.items() if count > 1}
+        if repeated:
+            logging.warning(f"Recomputed within one request: {repeated}")
+        response.headers['X-Memo-Computations'] = ', '.join(
+            f"{name}={count}" for name, count in sorted(self.computations().items())
+        )
+        return response
+
+
+request_memo = RequestMemo()
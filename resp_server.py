@@ -0,0 +1,170 @@
+"""
+A small in-memory server speaking the subset of the Redis protocol used by
+cache_backends.RedisBackend (PING, AUTH, SELECT, GET, SET [EX|PX], DEL,
+EXISTS, SCAN, DBSIZE, FLUSHDB, INFO). It evicts least recently used keys
+beyond --max-keys, like Redis with maxmemory-policy allkeys-lru.
+
+For local development and benchmarks only:
+
+    python resp_server.py --port 6390
+    CACHE_BACKEND=redis CACHE_URL=redis://localhost:6390/0 flask run
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+class Store:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.data = OrderedDict()  # key -> (value, expires_at)
+        self.evicted_keys = 0
+        self.started = time.time()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl_ms=None):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, time.time() + ttl_ms / 1000 if ttl_ms else None)
+            while len(self.data) > self.max_keys:
+                self.data.popitem(last=False)
+                self.evicted_keys += 1
+
+    def delete(self, keys):
+        with self.lock:
+            return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.data)
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b''.join(encode(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return f"${len(value)}\r\n".encode() + value + b"\r\n"
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()  # inline command (e.g. from telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].decode('ascii', 'replace').upper()
+            try:
+                reply = self.dispatch(store, name, args[1:])
+            except (IndexError, ValueError):
+                reply = f"-ERR wrong arguments for '{name.lower()}' command\r\n".encode()
+            self.wfile.write(reply)
+            if name == 'QUIT':
+                return
+
+    def dispatch(self, store, name, args):
+        if name == 'PING':
+            return b"+PONG\r\n"
+        if name in ('AUTH', 'SELECT', 'QUIT'):
+            return b"+OK\r\n"
+        if name == 'GET':
+            return encode(store.get(args[0]))
+        if name == 'SET':
+            ttl_ms = None
+            options = [arg.upper() for arg in args[2:]]
+            if b'PX' in options:
+                ttl_ms = int(args[2 + options.index(b'PX') + 1])
+            elif b'EX' in options:
+                ttl_ms = int(args[2 + options.index(b'EX') + 1]) * 1000
+            store.set(args[0], args[1], ttl_ms)
+            return b"+OK\r\n"
+        if name == 'DEL':
+            return encode(store.delete(args))
+        if name == 'EXISTS':
+            return encode(sum(1 for key in args if store.get(key) is not None))
+        if name == 'DBSIZE':
+            return encode(len(store.keys()))
+        if name == 'FLUSHDB':
+            store.delete(store.keys())
+            return b"+OK\r\n"
+        if name == 'SCAN':
+            # Single pass: returns every match with cursor 0
+            options = [arg.upper() for arg in args[1:]]
+            pattern = args[1 + options.index(b'MATCH') + 1] if b'MATCH' in options else b'*'
+            keys = [key for key in store.keys() if fnmatch.fnmatchcase(key, pattern)]
+            return encode([b'0', keys])
+        if name == 'INFO':
+            size = sum(len(key) + len(value) for key, (value, _) in list(store.data.items()))
+            info = (
+                f"# Server\r\nredis_version:stand-in\r\nuptime_in_seconds:{int(time.time() - store.started)}\r\n"
+                f"# Memory\r\nused_memory:{size}\r\n"
+                f"# Stats\r\nevicted_keys:{store.evicted_keys}\r\n"
+                f"# Keyspace\r\ndb0:keys={len(store.data)}\r\n"
+            )
+            return encode(info)
+        return f"-ERR unknown command '{name.lower()}'\r\n".encode()
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, max_keys=100000):
+        super().__init__(address, RESPHandler)
+        self.store = Store(max_keys)
+
+
+def serve_in_thread(host='127.0.0.1', port=0, max_keys=100000):
+    """
+    Start a stand-in server on a background thread; returns (server, port).
+    """
+    server = RESPServer((host, port), max_keys)
+    thread = threading.Thread(target=server.serve_forever, name='resp-server', daemon=True)
+    thread.start()
+    return server, server.server_address[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--max-keys', type=int, default=100000)
+    options = parser.parse_args()
+
+    with RESPServer((options.host, options.port), options.max_keys) as server:
+        print(f"Listening on {options.host}:{options.port}")
+        server.serve_forever()
@@ -0,0 +1,220 @@
+from datetime import timedelta
+
+from sqlalchemy import event, func, select, union_all, literal, inspect, delete, insert
+from sqlalchemy.orm import Session
+
+from app import db
+from database import upsert
+from models import Activity, ActivityRollup, to_kg
+from data_version import bump_data_versions, bump_all_data_versions
+from date_buckets import date_bucket, bucket_start, next_bucket
+
+# Attributes that move an activity between rollup buckets or change its value
+ROLLUP_FIELDS = ('company_id', 'date', 'category', 'emission_value', 'emission_unit')
+
+
+def month_start(day):
+    return bucket_start(day, 'month')
+
+
+def next_month(day):
+    return next_bucket(day, 'month')
+
+
+class RollupDeltas:
+    """
+    Accumulates (company_id, month, category) -> [total, count] changes.
+    """
+
+    def __init__(self):
+        self.deltas = {}
+
+    def add(self, company_id, day, category, value, count=1):
+        key = (company_id, month_start(day), category)
+        delta = self.deltas.setdefault(key, [0.0, 0])
+        delta[0] += value or 0
+        delta[1] += count
+
+    def add_activity(self, values, sign=1):
+        emission_kg = to_kg(values['emission_value'], values['emission_unit']) or 0
+        self.add(values['company_id'], values['date'], values['category'], sign * emission_kg, sign)
+
+    def __bool__(self):
+        return any(count or total for total, count in self.deltas.values())
+
+    def items(self):
+        # In key order, so concurrent writers lock rollup rows in the same order and cannot deadlock
+        return sorted((key, delta) for key, delta in self.deltas.items() if delta[0] or delta[1])
+
+
+def apply_rollup_deltas(connection, deltas):
+    """
+    Add `deltas` to the rollup table on `connection` (inside the caller's transaction).
+    """
+    items = deltas.items()
+    if not items:
+        return
+
+    table = ActivityRollup.__table__
+    rows = [
+        {'company_id': company_id, 'month': month, 'category': category, 'total': total, 'count': count}
+        for (company_id, month, category), (total, count) in items
+    ]
+
+    upsert(connection, table, rows, [table.c.company_id, table.c.month, table.c.category],
+           lambda excluded: {'total': table.c.total + excluded.total, 'count': table.c.count + excluded.count})
+
+    # Buckets with no activities left would otherwise show up as empty categories/months
+    company_ids = {row['company_id'] for row in rows}
+    connection.execute(
+        delete(table).where(table.c.company_id.in_(company_ids), table.c.count <= 0)
+    )
+
+
+def _activity_values(obj, previous=False):
+    values = {}
+    state = inspect(obj)
+    for field in ROLLUP_FIELDS:
+        if previous:
+            history = state.attrs[field].history
+            if history.deleted:
+                values[field] = history.deleted[0]
+            elif history.unchanged:
+                values[field] = history.unchanged[0]
+            else:
+                values[field] = getattr(obj, field)
+        else:
+            values[field] = getattr(obj, field)
+    return values
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Make SQLAlchemy load the old value when an expired attribute is overwritten,
+# so the flush hook can take it out of its previous bucket
+for _field in ROLLUP_FIELDS:
+    event.listen(getattr(Activity, _field), 'set', _load_previous_value, active_history=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def update_rollups_after_flush(session, flush_context):
+    # Runs inside the flush transaction, so rollups commit or roll back with the activities
+    deltas = RollupDeltas()
+
+    for obj in session.new:
+        if isinstance(obj, Activity):
+            deltas.add_activity(_activity_values(obj))
+
+    for obj in session.deleted:
+        if isinstance(obj, Activity):
+            deltas.add_activity(_activity_values(obj, previous=True), sign=-1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Activity) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[field].history.has_changes() for field in ROLLUP_FIELDS):
+            continue
+        deltas.add_activity(_activity_values(obj, previous=True), sign=-1)
+        deltas.add_activity(_activity_values(obj))
+
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def rebuild_rollups(company_id=None):
+    """
+    Recompute rollup rows from the activity table (all companies or one).
+    Returns the number of rollup rows written.
+    """
+    table = ActivityRollup.__table__
+    month = date_bucket(Activity.date, 'month')
+
+    source = select(
+        Activity.company_id,
+        month.label('month'),
+        Activity.category,
+        func.sum(Activity.emission_kg),
+        func.count(Activity.id),
+    ).group_by(Activity.company_id, month, Activity.category)
+
+    clear = delete(table)
+    if company_id is not None:
+        source = source.where(Activity.company_id == company_id)
+        clear = clear.where(table.c.company_id == company_id)
+
+    db.session.execute(clear)
+    result = db.session.execute(
+        insert(table).from_select(['company_id', 'month', 'category', 'total', 'count'], source)
+    )
+    if company_id is not None:
+        bump_data_versions(db.session.connection(), [company_id])
+    else:
+        bump_all_data_versions(db.session.connection())
+    db.session.commit()
+    return result.rowcount
+
+
+def rollup_source(company_id, from_date=None, to_date=None):
+    """
+    Selectable of (month, category, total, count) for one company and date range.
+
+    Whole months inside the range come from the rollup table; the partial
+    months at either end of the range are aggregated from raw activities.
+    """
+    rollup = ActivityRollup.__table__
+    parts = []
+
+    full_from = from_date if from_date is None or from_date.day == 1 else next_month(from_date)
+    full_to = None if to_date is None else month_start(to_date + timedelta(days=1))
+
+    if from_date is not None and to_date is not None and from_date > to_date:
+        edges = []
+        full = False
+    elif from_date is not None and to_date is not None and full_from >= full_to \
+            and month_start(from_date) == month_start(to_date):
+        # Part of a single month
+        edges = [(from_date, to_date)]
+        full = False
+    else:
+        # Partial months at either end, possibly with no whole month between them
+        edges = []
+        if from_date is not None and from_date != full_from:
+            edges.append((from_date, full_from - timedelta(days=1)))
+        if to_date is not None and full_to <= to_date:
+            edges.append((full_to, to_date))
+        full = full_from is None or full_to is None or full_from < full_to
+
+    if full:
+        query = select(rollup.c.month, rollup.c.category, rollup.c.total, rollup.c.count)\
+            .where(rollup.c.company_id == company_id)
+        if full_from is not None:
+            query = query.where(rollup.c.month >= full_from)
+        if full_to is not None:
+            query = query.where(rollup.c.month < full_to)
+        parts.append(query)
+
+    for edge_from, edge_to in edges:
+        parts.append(
+            select(
+                literal(month_start(edge_from), db.Date).label('month'),
+                Activity.category,
+                func.sum(Activity.emission_kg).label('total'),
+                func.count(Activity.id).label('count'),
+            ).where(
+                Activity.company_id == company_id,
+                Activity.date >= edge_from,
+                Activity.date <= edge_to,
+            ).group_by(Activity.category)
+        )
+
+    if not parts:
+        parts.append(
+            select(rollup.c.month, rollup.c.category, rollup.c.total, rollup.c.count).where(False)
+        )
+
+    if len(parts) == 1:
+        return parts[0].subquery('rollup_source')
+    return union_all(*parts).subquery('rollup_source')
@@ -1,20 +1,35 @@
-from flask import render_template, url_for, flash, redirect, request, jsonify
+from flask import render_template, url_for, flash, redirect, request, jsonify, Response, stream_with_context, g
 from app import db
-from models import Company, Activity, EmissionTarget
-from forms import RegistrationForm, LoginForm, ActivityForm, EmissionTargetForm
+from models import Company, Activity, EmissionTarget, IdempotencyKey, to_kg
+from forms import RegistrationForm, LoginForm, ActivityForm, EmissionTargetForm, ActivityImportForm, BulkActionForm
 from flask_login import login_user, current_user, logout_user, login_required
 from datetime import datetime
-from sqlalchemy import func
 import json
 import logging
-from utils import get_emission_stats, generate_pdf, get_global_co2_data
+from utils import get_emission_stats, generate_pdf, activity_filter_clauses, keyset_page, ACTIVITY_LIST_COLUMNS
+from stats import dashboard_summary, targets_summary, category_chart_data, emission_trend
+from view_cache import view_cache
+from conditional import conditional_data_response
+from cache_backends import cache
+from exports import EXPORT_FORMATS
+from importer import import_activities_csv
+from bulk_actions import count_matching_activities, bulk_delete_activities, bulk_recategorize_activities, BulkActionConflict
+from ingest import ingest_activities, validate_items, IngestValidationError
+from ingest_buffer import ingest_buffer, IngestBufferError
+from api_keys import api_key_required
+from principals import operator_required
+from date_buckets import GRANULARITIES
+from database import replica_reads, replica_router
+from co2_service import co2_service
+from co2_sources import co2_engine
+from co2_history import co2_history_store
 
 def register_routes(app):
     
     @app.route('/')
     def index():
-        # Get global CO2 data for the ticker
-        global_co2_data = get_global_co2_data()
+        # Get global CO2 data for the ticker (served from the background-refreshed cache)
+        global_co2_data = co2_service.get_data()
         
         # Debug: Log the CO2 data to console
         logging.debug(f"CO2 Data: {global_co2_data}")
@@ -37,6 +52,38 @@ def register_routes(app):
             
         return render_template('index.html', title='Carbon Footprint Tracker', global_co2_data=global_co2_data)
     
+    @app.route('/api/global_co2/status')
+    def global_co2_status():
+        # Cache age and hit/miss counters for the CO2 ticker in this worker
+        return jsonify(dict(co2_service.metrics(), sources=co2_engine.metrics()))
+    
+    @app.route('/api/global_co2/history')
+    def global_co2_history():
+        # Optional date range and server-side downsampling for the landing page chart
+        try:
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+            end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD'}), 400
+        
+        points = request.args.get('points', type=int)
+        if points is not None:
+            points = max(1, min(points, 5000))
+        
+        history = co2_history_store.get()
+        if not len(history):
+            # This worker may not have served the landing page yet
+            co2_service.start()
+            history = co2_engine.load_history()
+        dates, values = history.series(start, end, points)
+        
+        return jsonify({
+            'labels': [d.isoformat() for d in dates],
+            'data': [round(v, 2) for v in values],
+            'unit': 'ppm',
+            'source': 'NOAA Global Monitoring Laboratory'
+        })
+    
     @app.route('/register', methods=['GET', 'POST'])
     def register():
         if current_user.is_authenticated:
@@ -87,51 +134,21 @@ def register_routes(app):
     
     @app.route('/dashboard')
     @login_required
+    @replica_reads
     def dashboard():
-        # Get summary statistics
-        total_emissions = current_user.get_total_emissions()
-        emissions_by_category = current_user.get_emissions_by_category()
-        
-        # Get recent activities (last 5)
-        recent_activities = Activity.query.filter_by(company_id=current_user.id)\
-            .order_by(Activity.date.desc()).limit(5).all()
-        
-        # Get emissions target
-        target = EmissionTarget.query.filter_by(
-            company_id=current_user.id, 
-            category='overall'
-        ).order_by(EmissionTarget.target_date.desc()).first()
-        
-        # Prepare chart data
-        chart_data = {
-            'labels': [cat for cat, _ in emissions_by_category],
-            'data': [float(val) for _, val in emissions_by_category]
-        }
-        
-        # Monthly emissions for trend chart (using SQLite date functions)
-        monthly_emissions = db.session.query(
-            func.strftime('%Y-%m', Activity.date).label('month'),
-            func.sum(Activity.emission_value).label('total')
-        ).filter_by(company_id=current_user.id)\
-         .group_by('month')\
-         .order_by('month')\
-         .limit(12)\
-         .all()
-        
-        trend_data = {
-            'labels': [month for month, _ in monthly_emissions],
-            'data': [float(total) for _, total in monthly_emissions]
-        }
+        # Recomputed only when the company's activities or targets change
+        data = view_cache.get_or_compute(current_user.id, 'dashboard', (),
+                                         lambda: dashboard_summary(current_user.id))
         
         return render_template(
             'dashboard.html', 
             title='Dashboard',
-            total_emissions=total_emissions,
-            emissions_by_category=emissions_by_category,
-            recent_activities=recent_activities,
-            target=target,
-            chart_data=json.dumps(chart_data),
-            trend_data=json.dumps(trend_data)
+            total_emissions=data['total_emissions'],
+            emissions_by_category=data['emissions_by_category'],
+            recent_activities=data['recent_activities'],
+            target=data['target'],
+            chart_data=json.dumps(data['chart_data']),
+            trend_data=json.dumps(data['trend_data'])
         )
     
     @app.route('/add_activity', methods=['GET', 'POST'])
@@ -140,18 +157,37 @@ def register_routes(app):
         form = ActivityForm()
         
         if form.validate_on_submit():
-            activity = Activity(
-                title=form.title.data,
-                category=form.category.data,
-                description=form.description.data,
-                date=form.date.data,
-                emission_value=form.emission_value.data,
-                emission_unit=form.emission_unit.data,
-                company_id=current_user.id
-            )
-            
-            db.session.add(activity)
-            db.session.commit()
+            if ingest_buffer.enabled:
+                # Committed together with other pending inserts by the buffer's writer thread
+                row = {
+                    'title': form.title.data,
+                    'category': form.category.data,
+                    'description': form.description.data,
+                    'date': form.date.data,
+                    'emission_value': form.emission_value.data,
+                    'emission_unit': form.emission_unit.data,
+                    'emission_kg': to_kg(form.emission_value.data, form.emission_unit.data)
+                }
+                try:
+                    submission = ingest_buffer.submit(current_user.id, [row])
+                    if ingest_buffer.wait_for_flush:
+                        submission.wait(ingest_buffer.wait_timeout)
+                except IngestBufferError:
+                    flash('The server is busy right now. Please submit the activity again.', 'danger')
+                    return render_template('add_activity.html', title='Add Activity', form=form), 503, {'Retry-After': '1'}
+            else:
+                activity = Activity(
+                    title=form.title.data,
+                    category=form.category.data,
+                    description=form.description.data,
+                    date=form.date.data,
+                    emission_value=form.emission_value.data,
+                    emission_unit=form.emission_unit.data,
+                    company_id=current_user.id
+                )
+                
+                db.session.add(activity)
+                db.session.commit()
             
             flash('Activity has been added successfully!', 'success')
             return redirect(url_for('activities'))
@@ -160,27 +196,23 @@ def register_routes(app):
     
     @app.route('/activities')
     @login_required
+    @replica_reads
     def activities():
         # Get filter parameters
         category = request.args.get('category', '')
         from_date = request.args.get('from_date', '')
         to_date = request.args.get('to_date', '')
         
-        # Base query
-        query = Activity.query.filter_by(company_id=current_user.id)
+        cursor = request.args.get('after', '')
+        page_size = request.args.get('per_page', app.config['ACTIVITIES_PAGE_SIZE'], type=int)
+        page_size = max(1, min(page_size, app.config['ACTIVITIES_MAX_PAGE_SIZE']))
         
-        # Apply filters
-        if category:
-            query = query.filter_by(category=category)
+        # Only the columns the table shows, as plain rows
+        query = db.session.query(*ACTIVITY_LIST_COLUMNS)\
+            .filter(*activity_filter_clauses(current_user.id, category, from_date, to_date))
         
-        if from_date:
-            query = query.filter(Activity.date >= datetime.strptime(from_date, '%Y-%m-%d').date())
-            
-        if to_date:
-            query = query.filter(Activity.date <= datetime.strptime(to_date, '%Y-%m-%d').date())
-        
-        # Get all activities with filters applied
-        activities = query.order_by(Activity.date.desc()).all()
+        # Keyset pagination on (date, id) so deep pages cost the same as the first
+        activities, next_cursor = keyset_page(query, cursor, page_size)
         
         # Get available categories for filter dropdown
         categories = db.session.query(Activity.category)\
@@ -189,6 +221,8 @@ def register_routes(app):
             .all()
         categories = [cat[0] for cat in categories]
         
+        bulk_form = BulkActionForm(category=category, from_date=from_date, to_date=to_date)
+        
         return render_template(
             'activities.html', 
             title='Activities',
@@ -196,9 +230,149 @@ def register_routes(app):
             categories=categories,
             category_filter=category,
             from_date=from_date,
-            to_date=to_date
+            to_date=to_date,
+            per_page=page_size,
+            is_first_page=not cursor,
+            next_cursor=next_cursor,
+            bulk_form=bulk_form
         )
     
+    @app.route('/activities/export')
+    @login_required
+    @replica_reads
+    def export_activities():
+        # Same filters as the activities page
+        category = request.args.get('category', '')
+        from_date = request.args.get('from_date', '')
+        to_date = request.args.get('to_date', '')
+        export_format = request.args.get('format', 'csv')
+        
+        if export_format not in EXPORT_FORMATS:
+            flash('Unsupported export format.', 'danger')
+            return redirect(url_for('activities'))
+        
+        clauses = activity_filter_clauses(current_user.id, category, from_date, to_date)
+        generate, mimetype, extension = EXPORT_FORMATS[export_format]
+        
+        # Stream rows as they are read so memory stays flat and bytes start flowing immediately
+        return Response(
+            stream_with_context(generate(clauses)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=activities.{extension}'}
+        )
+    
+    @app.route('/activities/import', methods=['GET', 'POST'])
+    @login_required
+    def import_activities():
+        form = ActivityImportForm()
+        result = None
+        
+        if form.validate_on_submit():
+            # Rows are validated and committed in batches straight from the upload stream
+            result = import_activities_csv(form.file.data.stream, current_user.id)
+            logging.info(f"Imported {result.inserted}/{result.rows_read} activities for company {current_user.id} "
+                         f"in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s)")
+            
+            if result.inserted:
+                flash(f'Imported {result.inserted} of {result.rows_read} activities.', 'success')
+            if result.error_count:
+                flash(f'{result.error_count} rows could not be imported.', 'warning')
+            elif not result.inserted:
+                flash('The file did not contain any activities.', 'info')
+        
+        return render_template('import_activities.html', title='Import Activities', form=form, result=result)
+    
+    @app.route('/api/activities:batch', methods=['POST'])
+    @api_key_required
+    def api_activities_batch():
+        # Accepts either a bare JSON array or {"activities": [...]}
+        payload = request.get_json(silent=True)
+        items = payload.get('activities') if isinstance(payload, dict) else payload
+        
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a JSON array of activities.'}), 400
+        if len(items) > app.config['API_BATCH_MAX_ITEMS']:
+            return jsonify({'error': f"At most {app.config['API_BATCH_MAX_ITEMS']} activities per batch."}), 413
+        
+        try:
+            if ingest_buffer.enabled:
+                rows, keys = validate_items(items)
+                submission = ingest_buffer.submit(g.api_company_id, rows, keys)
+                if not ingest_buffer.wait_for_flush:
+                    return jsonify({'queued': len(rows)}), 202
+                results = submission.wait(ingest_buffer.wait_timeout)
+            else:
+                results = ingest_activities(g.api_company_id, items)
+        except IngestValidationError as e:
+            # Nothing is written unless the whole batch is valid
+            return jsonify({'errors': e.errors}), 422
+        except IngestBufferError as e:
+            # Backpressure: the client should retry the same batch (idempotency keys make that safe)
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        
+        created = sum(1 for result in results if result['status'] == 'created')
+        return jsonify({
+            'created': created,
+            'duplicates': len(results) - created,
+            'results': results
+        }), 201 if created else 200
+    
+    @app.route('/api/ingest/status')
+    @login_required
+    @operator_required
+    def ingest_status():
+        return jsonify(ingest_buffer.metrics())
+    
+    @app.route('/activities/bulk', methods=['POST'])
+    @login_required
+    def bulk_activities():
+        # Same filters as the activities page, plus optionally ticked rows
+        form = BulkActionForm()
+        category = form.category.data or ''
+        from_date = form.from_date.data or ''
+        to_date = form.to_date.data or ''
+        back = redirect(url_for('activities', category=category, from_date=from_date, to_date=to_date))
+        
+        if not form.validate_on_submit():
+            flash('The bulk action could not be applied; please reload the page and try again.', 'danger')
+            return back
+        
+        action = form.action.data
+        new_category = form.new_category.data
+        dry_run = form.dry_run.data
+        
+        clauses = activity_filter_clauses(current_user.id, category, from_date, to_date)
+        ids = [int(value) for value in request.form.getlist('ids') if value.isdigit()]
+        if ids:
+            clauses.append(Activity.id.in_(ids))
+        
+        if dry_run:
+            count = count_matching_activities(clauses)
+            verb = 'deleted' if action == 'delete' else f"moved to {new_category.replace('_', ' ').title()}"
+            flash(f'{count} activities would be {verb}.', 'info')
+            return back
+        
+        try:
+            if action == 'delete':
+                count = bulk_delete_activities(current_user.id, clauses)
+                flash(f'Deleted {count} activities.', 'success')
+            else:
+                count = bulk_recategorize_activities(current_user.id, clauses, new_category)
+                flash(f"Moved {count} activities to {new_category.replace('_', ' ').title()}.", 'success')
+        except BulkActionConflict as e:
+            logging.warning(f"Bulk {action} for company {current_user.id} rolled back: {str(e)}")
+            flash('Other changes to your activities were being saved at the same time, so nothing was changed. Please try again.', 'warning')
+        return back
+    
+    @app.route('/api/cache/status')
+    @login_required
+    @operator_required
+    def cache_status():
+        return jsonify({'views': view_cache.metrics(), 'cache': cache.metrics(), 'replica': replica_router.metrics()})
+    
     @app.route('/delete_activity/<int:activity_id>', methods=['POST'])
     @login_required
     def delete_activity(activity_id):
@@ -209,6 +383,9 @@ def register_routes(app):
             flash('You do not have permission to delete this activity.', 'danger')
             return redirect(url_for('activities'))
         
+        # Forget its idempotency key so re-sending the reading creates it again
+        IdempotencyKey.query.filter_by(company_id=current_user.id, activity_id=activity.id)\
+            .delete(synchronize_session=False)
         db.session.delete(activity)
         db.session.commit()
         
@@ -235,43 +412,45 @@ def register_routes(app):
             flash('Emission target has been set!', 'success')
             return redirect(url_for('targets'))
         
-        # Get current targets
-        targets = EmissionTarget.query.filter_by(company_id=current_user.id)\
-            .order_by(EmissionTarget.category, EmissionTarget.target_date).all()
-            
-        # Current emissions for comparison
-        emissions_by_category = dict(current_user.get_emissions_by_category())
-        total_emissions = current_user.get_total_emissions()
+        data = view_cache.get_or_compute(current_user.id, 'targets', (),
+                                         lambda: targets_summary(current_user))
         
         return render_template(
             'targets.html',
             title='Emission Targets',
             form=form,
-            targets=targets,
-            emissions_by_category=emissions_by_category,
-            total_emissions=total_emissions
+            targets=data['targets'],
+            emissions_by_category=data['emissions_by_category'],
+            total_emissions=data['total_emissions']
         )
     
     @app.route('/reports')
     @login_required
+    @replica_reads
     def reports():
         # Get filter parameters
         from_date = request.args.get('from_date', '')
         to_date = request.args.get('to_date', '')
         
-        # Get emission stats for the period
-        stats = get_emission_stats(current_user.id, from_date, to_date)
+        def render_report():
+            # Get emission stats for the period
+            stats = get_emission_stats(current_user.id, from_date, to_date)
+            
+            return render_template(
+                'reports.html',
+                title='Emission Reports',
+                stats=stats,
+                from_date=from_date,
+                to_date=to_date
+            )
         
-        return render_template(
-            'reports.html',
-            title='Emission Reports',
-            stats=stats,
-            from_date=from_date,
-            to_date=to_date
-        )
+        # 304 for an unchanged report without running the aggregation
+        return conditional_data_response(current_user.id, 'reports', (from_date, to_date), render_report,
+                                         fragment=True)
     
     @app.route('/generate_report_pdf')
     @login_required
+    @replica_reads
     def generate_report_pdf():
         # Get filter parameters
         from_date = request.args.get('from_date', '')
@@ -288,13 +467,36 @@ def register_routes(app):
     
     @app.route('/api/chart_data')
     @login_required
+    @replica_reads
     def chart_data():
-        # Get emissions by category for the pie chart
-        emissions_by_category = current_user.get_emissions_by_category()
+        # Pollers get a 304 from one version lookup while the data is unchanged
+        return conditional_data_response(
+            current_user.id, 'chart_data', (),
+            lambda: jsonify(view_cache.get_or_compute(current_user.id, 'chart_data', (),
+                                                      lambda: category_chart_data(current_user)))
+        )
+    
+    @app.route('/api/trend_data')
+    @login_required
+    @replica_reads
+    def trend_data():
+        # Emissions per day/week/month/quarter/year over an optional date range
+        granularity = request.args.get('granularity', 'month')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        try:
+            start = datetime.strptime(request.args['from_date'], '%Y-%m-%d').date() if request.args.get('from_date') else None
+            end = datetime.strptime(request.args['to_date'], '%Y-%m-%d').date() if request.args.get('to_date') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD'}), 400
         
-        chart_data = {
-            'labels': [cat for cat, _ in emissions_by_category],
-            'data': [float(val) for _, val in emissions_by_category]
-        }
+        def build():
+            trend = view_cache.get_or_compute(current_user.id, 'trend', (granularity, start, end),
+                                              lambda: emission_trend(current_user.id, granularity, start, end))
+            return jsonify({
+                'granularity': granularity,
+                'labels': [label for label, _ in trend],
+                'data': [float(total) for _, total in trend]
+            })
         
-        return jsonify(chart_data)
+        return conditional_data_response(current_user.id, 'trend_data', (granularity, start, end), build)
@@ -0,0 +1,121 @@
+import logging
+
+from sqlalchemy import inspect, select, update, case
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+from models import Activity, EmissionTarget, ActivityRollup, UNIT_TO_KG
+
+
+def init_schema():
+    """
+    Create any missing tables, columns and indexes, and backfill derived
+    data that did not exist before.
+    """
+    had_rollups = inspect(db.engine).has_table(ActivityRollup.__tablename__)
+
+    db.create_all()
+    add_missing_columns()
+    ensure_indexes()
+    ensure_foreign_key_actions()
+
+    backfilled = backfill_emission_kg()
+
+    if backfilled or not had_rollups:
+        from rollups import rebuild_rollups
+        rebuild_rollups()
+
+
+def add_missing_columns():
+    """
+    Add nullable columns that exist on the models but not in the database
+    (create_all never alters existing tables).
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                logging.info(f"Added column {table.name}.{column.name}")
+
+
+def ensure_indexes():
+    """
+    create_all only builds indexes together with new tables, so add any that
+    are missing from tables created by an older version of the models.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def ensure_foreign_key_actions():
+    """
+    Recreate foreign keys whose ON DELETE action changed on the models
+    (create_all never alters existing tables). PostgreSQL only: SQLite
+    cannot alter constraints and does not enforce them here.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {
+                tuple(fk['constrained_columns']): fk for fk in inspector.get_foreign_keys(table.name)
+            }
+            for constraint in table.foreign_key_constraints:
+                fk = existing.get(tuple(constraint.column_keys))
+                if fk is None or (fk['options'].get('ondelete') or None) == constraint.ondelete:
+                    continue
+                columns = ', '.join(constraint.column_keys)
+                referred = ', '.join(element.column.name for element in constraint.elements)
+                action = f" ON DELETE {constraint.ondelete}" if constraint.ondelete else ''
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} DROP CONSTRAINT "{fk["name"]}"')
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD CONSTRAINT "{fk["name"]}" FOREIGN KEY ({columns}) '
+                    f'REFERENCES {constraint.referred_table.name} ({referred}){action}'
+                )
+                logging.info(f"Recreated foreign key {table.name}.{fk['name']}{action}")
+
+
+def _kg_expression(value_column, unit_column):
+    return value_column * case(UNIT_TO_KG, value=unit_column, else_=1.0)
+
+
+def backfill_emission_kg(batch_size=1000):
+    """
+    Populate emission_kg / target_kg for rows written before the columns
+    existed, committing every `batch_size` rows so the write lock is never
+    held for long. Returns the number of rows updated.
+    """
+    updated = 0
+    for model, pk, kg_column, expression in (
+        (Activity, Activity.id, Activity.emission_kg,
+         _kg_expression(Activity.emission_value, Activity.emission_unit)),
+        (EmissionTarget, EmissionTarget.id, EmissionTarget.target_kg,
+         _kg_expression(EmissionTarget.target_value, EmissionTarget.target_unit)),
+    ):
+        while True:
+            batch = select(pk).where(kg_column.is_(None)).limit(batch_size).scalar_subquery()
+            result = db.session.execute(
+                update(model).where(pk.in_(batch)).values({kg_column: expression})
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+            if result.rowcount < batch_size:
+                break
+
+    if updated:
+        logging.info(f"Backfilled canonical kg values for {updated} rows")
+    return updated
@@ -0,0 +1,67 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution: the
+    first caller runs the function and the others in this process wait for
+    its result (or its exception) instead of repeating the work.
+
+    Only calls that overlap are shared; nothing is kept once the leader
+    finishes. Followers that wait longer than `timeout` seconds give up and
+    run the function themselves.
+    """
+
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executions': 0, 'coalesced': 0, 'timeouts': 0, 'max_waiters': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['executions'] += 1
+            else:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                self._stats['max_waiters'] = max(self._stats['max_waiters'], call.waiters)
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._calls))
+        calls = stats['executions'] + stats['coalesced']
+        stats['coalesced_rate'] = round(stats['coalesced'] / calls, 3) if calls else None
+        return stats
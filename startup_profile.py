@@ -0,0 +1,74 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+# Run in a fresh interpreter, so nothing is imported yet
+BOOT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+app = {module}.create_app()
+built = time.perf_counter()
+print(json.dumps({{'import_seconds': imported - started, 'create_app_seconds': built - imported,
+                  'modules': len(sys.modules)}}))
+"""
+
+
+def parse_import_times(stderr):
+    """
+    -X importtime output as {module: (self_us, cumulative_us, depth)}.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+def profile_once(root, module='app'):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT.format(module=module)],
+        cwd=root, env=env, capture_output=True, text=True, timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'boot failed')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_import_times(result.stderr)
+    return timings
+
+
+def profile_startup(root, runs=3, module='app'):
+    """
+    Boot the app `runs` times in fresh interpreters and keep the fastest
+    timing of each measurement (the least disturbed by noise).
+
+    Returns {'import_seconds', 'create_app_seconds', 'total_seconds',
+    'modules', 'imports': {name: (self_us, cumulative_us, depth)},
+    'project_modules': set of module names that live in `root`}.
+    """
+    best = None
+    for _ in range(runs):
+        timings = profile_once(root, module)
+        if best is None:
+            best = timings
+            continue
+        for key in ('import_seconds', 'create_app_seconds'):
+            best[key] = min(best[key], timings[key])
+        for name, (self_us, cumulative_us, depth) in timings['imports'].items():
+            previous = best['imports'].get(name)
+            if previous is None or cumulative_us < previous[1]:
+                best['imports'][name] = (self_us, cumulative_us, depth)
+
+    best['total_seconds'] = best['import_seconds'] + best['create_app_seconds']
+    best['project_modules'] = {
+        name[:-3] for name in os.listdir(root) if name.endswith('.py')
+    } & set(best['imports'])
+    return best
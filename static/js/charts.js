@@ -8,6 +8,10 @@ document.addEventListener('DOMContentLoaded', function() {
     if (document.getElementById('emissionsTrendChart')) {
         initializeTrendChart();
     }
+    
+    if (document.getElementById('globalCo2Chart')) {
+        initializeGlobalCo2Chart();
+    }
 });
 
 // Initialize pie chart for emissions by category
@@ -132,6 +136,73 @@ function initializeTrendChart() {
     });
 }
 
+// Initialize global CO2 history chart on the landing page
+function initializeGlobalCo2Chart() {
+    const canvas = document.getElementById('globalCo2Chart');
+    
+    fetch(canvas.getAttribute('data-url'))
+        .then(response => response.json())
+        .then(history => {
+            if (!history.labels || history.labels.length === 0) {
+                canvas.parentElement.style.display = 'none';
+                return;
+            }
+            
+            new Chart(canvas.getContext('2d'), {
+                type: 'line',
+                data: {
+                    labels: history.labels,
+                    datasets: [{
+                        label: 'Global CO2',
+                        data: history.data,
+                        borderColor: '#0dcaf0',
+                        backgroundColor: 'rgba(13, 202, 240, 0.1)',
+                        borderWidth: 2,
+                        tension: 0.3,
+                        fill: true,
+                        pointRadius: 0
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    plugins: {
+                        legend: {
+                            display: false
+                        },
+                        tooltip: {
+                            callbacks: {
+                                label: function(context) {
+                                    return `${context.raw} ${history.unit}`;
+                                }
+                            }
+                        }
+                    },
+                    scales: {
+                        x: {
+                            grid: {
+                                color: 'rgba(255, 255, 255, 0.1)'
+                            },
+                            ticks: {
+                                color: '#fff',
+                                maxTicksLimit: 12
+                            }
+                        },
+                        y: {
+                            grid: {
+                                color: 'rgba(255, 255, 255, 0.1)'
+                            },
+                            ticks: {
+                                color: '#fff'
+                            }
+                        }
+                    }
+                }
+            });
+        })
+        .catch(error => console.error('Could not load global CO2 history', error));
+}
+
 // Generate a color palette for the charts
 function generateColorPalette(count) {
     const baseColors = [
@@ -0,0 +1,160 @@
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from app import db
+from models import Activity, EmissionTarget
+from rollups import rollup_source
+from date_buckets import date_bucket, bucket_range, bucket_start, next_bucket
+
+# Activity fields shown in summaries, returned as plain dicts so results can be cached
+ACTIVITY_SUMMARY_COLUMNS = (
+    Activity.id,
+    Activity.title,
+    Activity.description,
+    Activity.category,
+    Activity.date,
+    Activity.emission_value,
+    Activity.emission_unit,
+    Activity.emission_kg,
+)
+
+TARGET_SUMMARY_COLUMNS = (
+    EmissionTarget.id,
+    EmissionTarget.category,
+    EmissionTarget.target_value,
+    EmissionTarget.target_unit,
+    EmissionTarget.target_kg,
+    EmissionTarget.target_date,
+)
+
+
+def compute_emission_stats(company_id, from_date=None, to_date=None, top_n=5):
+    """
+    Total, per-category and per-month emissions (kg CO2e) plus the top-N
+    activities for one company and optional date range.
+
+    The three aggregates are derived from a single grouped query over the
+    (month, category) rollup rows, so the cost scales with months x
+    categories. The top-N list (as dicts) is one more query served by the
+    (company_id, emission_kg) index; pass top_n=0 to skip it.
+    """
+    source = rollup_source(company_id, from_date, to_date)
+    rows = db.session.query(
+        source.c.month,
+        source.c.category,
+        func.sum(source.c.total)
+    ).group_by(source.c.month, source.c.category).all()
+
+    total_emissions = 0
+    by_category = {}
+    by_month = {}
+    for month, category, total in rows:
+        total = total or 0
+        total_emissions += total
+        by_category[category] = by_category.get(category, 0) + total
+        by_month[month] = by_month.get(month, 0) + total
+
+    highest_emissions = []
+    if top_n:
+        query = db.session.query(*ACTIVITY_SUMMARY_COLUMNS).filter(Activity.company_id == company_id)
+        if from_date:
+            query = query.filter(Activity.date >= from_date)
+        if to_date:
+            query = query.filter(Activity.date <= to_date)
+        highest_emissions = [row._asdict() for row in query.order_by(Activity.emission_kg.desc()).limit(top_n)]
+
+    return {
+        'total_emissions': total_emissions,
+        'by_category': sorted(by_category.items()),
+        'monthly_trend': [(month.strftime('%Y-%m'), by_month[month]) for month in sorted(by_month)],
+        'highest_emissions': highest_emissions
+    }
+
+
+def emission_trend(company_id, granularity='month', from_date=None, to_date=None):
+    """
+    Emissions (kg CO2e) per day, week, month, quarter or year, as
+    [(bucket start ISO date, total)], covering every whole bucket that
+    overlaps the optional date range.
+
+    Month and coarser buckets are summed from the monthly rollups; days and
+    weeks from activities, through the (company_id, date) index.
+    """
+    if granularity in ('day', 'week'):
+        bucket = date_bucket(Activity.date, granularity)
+        rows = db.session.query(bucket, func.sum(Activity.emission_kg))\
+            .filter(Activity.company_id == company_id,
+                    bucket_range(Activity.date, granularity, from_date, to_date))\
+            .group_by(bucket).order_by(bucket).all()
+    else:
+        source = rollup_source(
+            company_id,
+            bucket_start(from_date, granularity) if from_date else None,
+            next_bucket(to_date, granularity) - timedelta(days=1) if to_date else None,
+        )
+        bucket = date_bucket(source.c.month, granularity)
+        rows = db.session.query(bucket, func.sum(source.c.total)).group_by(bucket).order_by(bucket).all()
+
+    return [(start.isoformat(), total or 0) for start, total in rows]
+
+
+def dashboard_summary(company_id):
+    """
+    Everything the dashboard shows, as plain data.
+    """
+    stats = compute_emission_stats(company_id, top_n=0)
+    emissions_by_category = stats['by_category']
+
+    recent_activities = db.session.query(*ACTIVITY_SUMMARY_COLUMNS)\
+        .filter(Activity.company_id == company_id)\
+        .order_by(Activity.date.desc()).limit(5).all()
+
+    target = db.session.query(*TARGET_SUMMARY_COLUMNS).filter(
+        EmissionTarget.company_id == company_id,
+        EmissionTarget.category == 'overall'
+    ).order_by(EmissionTarget.target_date.desc()).first()
+
+    monthly_emissions = stats['monthly_trend'][:12]
+
+    return {
+        'total_emissions': stats['total_emissions'],
+        'emissions_by_category': emissions_by_category,
+        'recent_activities': [row._asdict() for row in recent_activities],
+        'target': target._asdict() if target else None,
+        'chart_data': {
+            'labels': [cat for cat, _ in emissions_by_category],
+            'data': [float(val) for _, val in emissions_by_category]
+        },
+        'trend_data': {
+            'labels': [month for month, _ in monthly_emissions],
+            'data': [float(total) for _, total in monthly_emissions]
+        }
+    }
+
+
+def targets_summary(company):
+    """
+    A company's targets with the current emissions to compare them against.
+    """
+    targets = db.session.query(*TARGET_SUMMARY_COLUMNS)\
+        .filter(EmissionTarget.company_id == company.id)\
+        .order_by(EmissionTarget.category, EmissionTarget.target_date).all()
+
+    return {
+        'targets': [row._asdict() for row in targets],
+        'emissions_by_category': dict(company.get_emissions_by_category()),
+        'total_emissions': company.get_total_emissions()
+    }
+
+
+def category_chart_data(company):
+    """
+    Emissions by category for the pie chart.
+    """
+    emissions_by_category = company.get_emissions_by_category()
+
+    return {
+        'labels': [cat for cat, _ in emissions_by_category],
+        'data': [float(val) for _, val in emissions_by_category]
+    }
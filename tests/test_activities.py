@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from api_keys import create_api_key
+from bulk_actions import bulk_delete_activities
+from ingest import ingest_activities, IngestValidationError
+from models import Activity, IdempotencyKey
+from utils import activity_filter_clauses, keyset_page
+from conftest import assert_rollups_match_rebuild
+
+
+def batch_items(count, prefix='key', category='energy'):
+    return [
+        {'title': f"Item {i}", 'category': category, 'date': (date(2024, 1, 1) + timedelta(days=i)).isoformat(),
+         'emission_value': 10 + i, 'emission_unit': 'kg', 'idempotency_key': f"{prefix}-{i}"}
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize('page_size', [1, 4, 7, 50])
+def test_keyset_pages_cover_every_row_once(company, page_size):
+    # Many rows share a date, so the id tiebreak decides page boundaries
+    for i in range(23):
+        db.session.add(Activity(company_id=company.id, title=f"A{i}", category='energy',
+                                date=date(2024, 3, 1) + timedelta(days=i % 3),
+                                emission_value=1, emission_unit='kg'))
+    db.session.commit()
+    expected = [(row.date, row.id) for row in Activity.query.filter_by(company_id=company.id)
+                .order_by(Activity.date.desc(), Activity.id.desc())]
+
+    query = db.session.query(Activity.id, Activity.date).filter(*activity_filter_clauses(company.id))
+    seen, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(query, cursor, page_size)
+        assert len(rows) <= page_size
+        seen.extend((row.date, row.id) for row in rows)
+        if cursor is None:
+            break
+
+    assert seen == expected
+
+
+def test_keyset_page_ignores_a_malformed_cursor(company):
+    db.session.add(Activity(company_id=company.id, title='Only', category='energy', date=date(2024, 1, 1),
+                            emission_value=1, emission_unit='kg'))
+    db.session.commit()
+    query = db.session.query(Activity.id, Activity.date).filter(*activity_filter_clauses(company.id))
+
+    rows, cursor = keyset_page(query, 'not-a-cursor', 10)
+
+    assert len(rows) == 1 and cursor is None
+
+
+def test_resent_batch_is_not_inserted_twice(company):
+    first = ingest_activities(company.id, batch_items(5))
+    again = ingest_activities(company.id, batch_items(6))
+
+    assert [result['status'] for result in first] == ['created'] * 5
+    assert [result['status'] for result in again] == ['duplicate'] * 5 + ['created']
+    assert [result['id'] for result in again[:5]] == [result['id'] for result in first]
+    assert Activity.query.filter_by(company_id=company.id).count() == 6
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_key_repeated_within_a_batch_is_rejected(company):
+    items = batch_items(3)
+    items[2]['idempotency_key'] = items[0]['idempotency_key']
+
+    with pytest.raises(IngestValidationError) as raised:
+        ingest_activities(company.id, items)
+
+    assert raised.value.errors == [{'index': 2, 'error': 'idempotency_key is repeated within the batch'}]
+    assert Activity.query.filter_by(company_id=company.id).count() == 0
+
+
+def test_deleting_an_activity_frees_its_key(client, company):
+    first = ingest_activities(company.id, batch_items(2))
+
+    response = client.post(f"/delete_activity/{first[0]['id']}")
+    assert response.status_code == 302
+
+    again = ingest_activities(company.id, batch_items(2))
+    assert [result['status'] for result in again] == ['created', 'duplicate']
+    assert again[0]['id'] != first[0]['id']
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_key_left_behind_by_a_deleted_activity_is_free(company):
+    first = ingest_activities(company.id, batch_items(1))
+    # Deleted without going through the routes, so its key row survives (SQLite has no cascade here)
+    db.session.delete(db.session.get(Activity, first[0]['id']))
+    db.session.commit()
+
+    again = ingest_activities(company.id, batch_items(1))
+
+    assert again[0]['status'] == 'created'
+    assert IdempotencyKey.query.filter_by(company_id=company.id).one().activity_id == again[0]['id']
+
+
+def test_bulk_delete_frees_keys(company):
+    ingest_activities(company.id, batch_items(4, category='waste'))
+
+    bulk_delete_activities(company.id, activity_filter_clauses(company.id, 'waste'))
+
+    assert IdempotencyKey.query.filter_by(company_id=company.id).count() == 0
+    again = ingest_activities(company.id, batch_items(4, category='waste'))
+    assert {result['status'] for result in again} == {'created'}
+
+
+def test_batch_api_is_idempotent(app, company):
+    _, raw_key = create_api_key(company.id, 'test')
+    client = app.test_client()
+    headers = {'Authorization': f"Bearer {raw_key}"}
+
+    created = client.post('/api/activities:batch', json=batch_items(3), headers=headers)
+    resent = client.post('/api/activities:batch', json={'activities': batch_items(3)}, headers=headers)
+
+    assert created.status_code == 201 and created.json['created'] == 3
+    assert resent.status_code == 200 and resent.json['duplicates'] == 3
+    assert [r['id'] for r in resent.json['results']] == [r['id'] for r in created.json['results']]
+
+    missing_key = client.post('/api/activities:batch', json=batch_items(1))
+    assert missing_key.status_code == 401
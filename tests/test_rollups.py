@@ -0,0 +1,125 @@
+import io
+from datetime import date, timedelta
+
+import pytest
+from pytest import approx
+from sqlalchemy import insert
+
+from app import db
+from bench import rollup_check_ranges, raw_monthly_trend, synthetic_activity_rows, synthetic_activity_csv
+from bulk_actions import bulk_delete_activities, bulk_recategorize_activities
+from importer import import_activities_csv
+from ingest import validate_items
+from ingest_buffer import ingest_buffer
+from models import Activity, to_kg
+from rollups import rebuild_rollups
+from stats import compute_emission_stats
+from utils import activity_filter_clauses
+from conftest import assert_rollups_match_rebuild
+
+
+def add_activities(company_id, count, months=4, seed=1):
+    for record in synthetic_activity_rows(count, months, seed):
+        db.session.add(Activity(company_id=company_id, **record))
+    db.session.commit()
+
+
+def test_orm_insert_update_delete(company):
+    add_activities(company.id, 60)
+    assert_rollups_match_rebuild(company.id)
+
+    activities = Activity.query.filter_by(company_id=company.id).order_by(Activity.id).all()
+    # Across months and categories, and between units
+    activities[0].date = activities[0].date - timedelta(days=40)
+    activities[1].category = 'waste' if activities[1].category != 'waste' else 'water'
+    activities[2].emission_value = activities[2].emission_value * 3
+    activities[3].emission_unit = 'tonnes' if activities[3].emission_unit == 'kg' else 'kg'
+    db.session.commit()
+    assert_rollups_match_rebuild(company.id)
+
+    for activity in activities[4:20]:
+        db.session.delete(activity)
+    db.session.commit()
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_csv_import(company):
+    data = synthetic_activity_csv(250, months=6, seed=2)
+    data += b"Bad date,energy,,2024-13-01,10,kg\nBad value,energy,,2024-01-01,lots,kg\n"
+
+    result = import_activities_csv(io.BytesIO(data), company.id, batch_size=100)
+
+    assert result.inserted == 250
+    assert result.error_count == 2
+    assert Activity.query.filter_by(company_id=company.id).count() == 250
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_ingest_buffer(company):
+    items = [dict(record, date=record['date'].isoformat(), idempotency_key=f"k{i}")
+             for i, record in enumerate(synthetic_activity_rows(40, seed=3))]
+    rows, keys = validate_items(items)
+
+    submissions = [ingest_buffer.submit(company.id, rows[i:i + 10], keys[i:i + 10]) for i in range(0, 40, 10)]
+    results = [result for submission in submissions for result in submission.wait(10)]
+    assert [result['status'] for result in results] == ['created'] * 40
+
+    # The same keys again are duplicates of the rows already written
+    again = ingest_buffer.submit(company.id, rows[:10], keys[:10]).wait(10)
+    assert [result['id'] for result in again] == [result['id'] for result in results[:10]]
+    assert {result['status'] for result in again} == {'duplicate'}
+
+    assert Activity.query.filter_by(company_id=company.id).count() == 40
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_bulk_delete(company):
+    add_activities(company.id, 120, seed=4)
+    count = Activity.query.filter_by(company_id=company.id, category='energy').count()
+
+    deleted = bulk_delete_activities(company.id, activity_filter_clauses(company.id, 'energy'))
+
+    assert deleted == count > 0
+    assert Activity.query.filter_by(company_id=company.id, category='energy').count() == 0
+    assert_rollups_match_rebuild(company.id)
+
+
+def test_bulk_recategorize(company):
+    add_activities(company.id, 120, seed=5)
+    from_date = (date.today() - timedelta(days=80)).isoformat()
+    to_date = (date.today() - timedelta(days=20)).isoformat()
+    clauses = activity_filter_clauses(company.id, None, from_date, to_date)
+    expected = Activity.query.filter(*clauses, Activity.category != 'other').count()
+
+    moved = bulk_recategorize_activities(company.id, clauses, 'other')
+
+    assert moved == expected > 0
+    assert Activity.query.filter(*clauses, Activity.category != 'other').count() == 0
+    assert_rollups_match_rebuild(company.id)
+
+
+CHECK_RANGES = rollup_check_ranges()
+
+
+@pytest.mark.parametrize('label, from_date, to_date', CHECK_RANGES, ids=[label for label, _, _ in CHECK_RANGES])
+def test_stats_match_raw_activities(company, label, from_date, to_date):
+    rows = list(synthetic_activity_rows(400, months=4, seed=6))
+    # Rows on the first and last day of each month, where range edges fall
+    this_month = date.today().replace(day=1)
+    for months_back in range(4):
+        start = (this_month - timedelta(days=31 * months_back)).replace(day=1)
+        for day in (start, start - timedelta(days=1)):
+            rows.append({'title': 'Edge', 'category': 'energy', 'description': '', 'date': day,
+                         'emission_value': 100, 'emission_unit': 'kg'})
+    for row in rows:
+        row.update(company_id=company.id, emission_kg=to_kg(row['emission_value'], row['emission_unit']))
+    db.session.execute(insert(Activity), rows)
+    db.session.commit()
+    rebuild_rollups(company.id)
+
+    expected = raw_monthly_trend(company.id, from_date, to_date)
+    stats = compute_emission_stats(company.id, from_date, to_date, top_n=0)
+
+    assert [month for month, _ in stats['monthly_trend']] == [month for month, _ in expected]
+    assert [total for _, total in stats['monthly_trend']] == approx([total for _, total in expected])
+    assert stats['total_emissions'] == approx(sum(total for _, total in expected))
@@ -0,0 +1,25 @@
+def test_cache_status_is_hidden_from_companies(client):
+    assert client.get('/api/cache/status').status_code == 404
+
+
+def test_cache_status_for_operators(app, client, company, monkeypatch):
+    monkeypatch.setitem(app.config, 'OPERATOR_EMAILS', {company.email})
+
+    response = client.get('/api/cache/status')
+
+    assert response.status_code == 200
+    assert set(response.json) == {'views', 'cache', 'replica'}
+    assert response.json['replica']['replica_configured'] is False
+
+
+def test_ingest_status_is_hidden_from_companies(client):
+    assert client.get('/api/ingest/status').status_code == 404
+
+
+def test_ingest_status_for_operators(app, client, company, monkeypatch):
+    monkeypatch.setitem(app.config, 'OPERATOR_EMAILS', {company.email})
+
+    response = client.get('/api/ingest/status')
+
+    assert response.status_code == 200
+    assert 'flushes' in response.json
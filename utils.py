@@ -1,181 +1,108 @@
 from flask import flash
-from sqlalchemy import func
 from datetime import datetime
-import requests
-import trafilatura
-import re
+from sqlalchemy import tuple_
+from co2_sources import co2_engine
 from models import Activity
+from stats import compute_emission_stats
+from view_cache import view_cache
 import json
 import logging
 
+# Columns the activity listing and exports need (no full ORM objects)
+ACTIVITY_LIST_COLUMNS = (
+    Activity.id,
+    Activity.title,
+    Activity.description,
+    Activity.category,
+    Activity.date,
+    Activity.emission_value,
+    Activity.emission_unit,
+)
+
 def get_emission_stats(company_id, from_date=None, to_date=None):
     """
     Get emission statistics for a company within a date range
     """
-    query = Activity.query.filter_by(company_id=company_id)
-    
-    # Apply date filters if provided
-    if from_date and from_date.strip():
-        try:
-            from_date_obj = datetime.strptime(from_date, '%Y-%m-%d').date()
-            query = query.filter(Activity.date >= from_date_obj)
-        except ValueError:
-            flash('Invalid from date format. Please use YYYY-MM-DD', 'warning')
+    from_date_obj = parse_date_filter(from_date, 'from date')
+    to_date_obj = parse_date_filter(to_date, 'to date')
     
-    if to_date and to_date.strip():
-        try:
-            to_date_obj = datetime.strptime(to_date, '%Y-%m-%d').date()
-            query = query.filter(Activity.date <= to_date_obj)
-        except ValueError:
-            flash('Invalid to date format. Please use YYYY-MM-DD', 'warning')
+    # Served from the cache until the company's data changes
+    return view_cache.get_or_compute(
+        company_id, 'emission_stats', (from_date_obj, to_date_obj),
+        lambda: compute_emission_stats(company_id, from_date_obj, to_date_obj)
+    )
+
+def parse_date_filter(value, label):
+    """
+    Parse a YYYY-MM-DD filter value, flashing a warning and returning None if invalid
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        flash(f'Invalid {label} format. Please use YYYY-MM-DD', 'warning')
+        return None
+
+def activity_filter_clauses(company_id, category=None, from_date=None, to_date=None):
+    """
+    WHERE clauses for the activities page filters (shared by listing, export and bulk actions)
+    """
+    clauses = [Activity.company_id == company_id]
     
-    # Calculate total emissions
-    total_emissions = query.with_entities(func.sum(Activity.emission_value)).scalar() or 0
+    if category:
+        clauses.append(Activity.category == category)
     
-    # Get emissions by category
-    emissions_by_category = query.with_entities(
-        Activity.category,
-        func.sum(Activity.emission_value).label('total')
-    ).group_by(Activity.category).all()
+    from_date_obj = parse_date_filter(from_date, 'from date')
+    if from_date_obj:
+        clauses.append(Activity.date >= from_date_obj)
     
-    # Get monthly trend (using SQLite date functions)
-    monthly_trend = query.with_entities(
-        func.strftime('%Y-%m', Activity.date).label('month'),
-        func.sum(Activity.emission_value).label('total')
-    ).group_by('month').order_by('month').all()
+    to_date_obj = parse_date_filter(to_date, 'to date')
+    if to_date_obj:
+        clauses.append(Activity.date <= to_date_obj)
     
-    # Get highest emission activities
-    highest_emissions = query.order_by(Activity.emission_value.desc()).limit(5).all()
+    return clauses
+
+def encode_cursor(row):
+    return f"{row.date.isoformat()}_{row.id}"
+
+def decode_cursor(cursor):
+    """
+    Returns the (date, id) keyset position encoded by `encode_cursor`, or None if invalid
+    """
+    try:
+        date_part, id_part = cursor.split('_', 1)
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_page(query, cursor, page_size):
+    """
+    One page of an activity query ordered by (date, id) descending, starting after `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.where(tuple_(Activity.date, Activity.id) < tuple_(*position))
     
-    return {
-        'total_emissions': total_emissions,
-        'by_category': emissions_by_category,
-        'monthly_trend': monthly_trend,
-        'highest_emissions': highest_emissions
-    }
+    # Fetch one extra row to know whether there is a next page without counting
+    rows = query.order_by(Activity.date.desc(), Activity.id.desc()).limit(page_size + 1).all()
+    if len(rows) > page_size:
+        return rows[:page_size], encode_cursor(rows[page_size - 1])
+    return rows, None
 
 def get_global_co2_data():
     """
     Fetches current global CO2 levels data from reliable sources.
     Returns a dict with current CO2 level, trend (up/down), and historical context.
+
+    NOAA, Mauna Loa and CO2.Earth are queried concurrently by `co2_engine`;
+    the most preferred source that answers within the deadline wins.
     """
     try:
-        # First attempt to get data from NOAA Global Monitoring Laboratory
-        url = "https://gml.noaa.gov/webdata/ccgg/trends/co2/co2_trend_gl.txt"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            # Parse the data (last line is the most recent)
-            lines = response.text.strip().split('\n')
-            data_lines = [line for line in lines if not line.startswith('#') and line.strip()]
-            
-            if data_lines:
-                # Get the most recent data
-                latest_data = data_lines[-1].split()
-                if len(latest_data) >= 2:
-                    # Format: Year Month Day CO2-level
-                    year = latest_data[0]
-                    month = int(latest_data[1])
-                    co2_level = float(latest_data[3])
-                    
-                    # Get historical data for context (one year ago)
-                    one_year_ago = None
-                    for line in reversed(data_lines):
-                        parts = line.split()
-                        if len(parts) >= 4 and int(parts[0]) == int(year) - 1 and int(parts[1]) == month:
-                            one_year_ago = float(parts[3])
-                            break
-                            
-                    # Determine trend
-                    trend = "stable"
-                    trend_value = 0
-                    if one_year_ago:
-                        trend_value = co2_level - one_year_ago
-                        if trend_value > 0:
-                            trend = "up"
-                        elif trend_value < 0:
-                            trend = "down"
-                            
-                    # Format date
-                    month_names = ["", "January", "February", "March", "April", "May", "June", 
-                                 "July", "August", "September", "October", "November", "December"]
-                    date_str = f"{month_names[month]} {year}"
-                    
-                    return {
-                        "success": True,
-                        "co2_level": co2_level,
-                        "trend": trend,
-                        "trend_value": abs(trend_value),
-                        "date": date_str,
-                        "source": "NOAA Global Monitoring Laboratory",
-                        "unit": "ppm",
-                        "historical": {
-                            "one_year_ago": one_year_ago
-                        }
-                    }
-        
-        # Fallback to Mauna Loa Observatory data
-        url = "https://www.esrl.noaa.gov/gmd/webdata/ccgg/trends/co2_mlo_weekly.txt"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            lines = response.text.strip().split('\n')
-            data_lines = [line for line in lines if not line.startswith('#') and line.strip()]
-            
-            if data_lines:
-                latest_data = data_lines[-1].split()
-                if len(latest_data) >= 5:
-                    year = latest_data[0]
-                    month = int(latest_data[1])
-                    co2_level = float(latest_data[4])
-                    
-                    # Get trend (compare to previous week)
-                    trend = "stable"
-                    trend_value = 0
-                    if len(data_lines) > 1:
-                        prev_data = data_lines[-2].split()
-                        if len(prev_data) >= 5:
-                            prev_co2 = float(prev_data[4])
-                            trend_value = co2_level - prev_co2
-                            if trend_value > 0:
-                                trend = "up"
-                            elif trend_value < 0:
-                                trend = "down"
-                    
-                    # Format date
-                    month_names = ["", "January", "February", "March", "April", "May", "June", 
-                                 "July", "August", "September", "October", "November", "December"]
-                    date_str = f"{month_names[month]} {year}"
-                    
-                    return {
-                        "success": True,
-                        "co2_level": co2_level,
-                        "trend": trend,
-                        "trend_value": abs(trend_value),
-                        "date": date_str,
-                        "source": "Mauna Loa Observatory",
-                        "unit": "ppm"
-                    }
-        
-        # If both direct sources fail, try to scrape from CO2.Earth
-        url = "https://www.co2.earth/"
-        downloaded = trafilatura.fetch_url(url)
-        text = trafilatura.extract(downloaded)
-        
-        if text:
-            # Try to extract the current CO2 value using regex
-            co2_match = re.search(r'(\d{3}\.\d{2})\s*ppm', text)
-            if co2_match:
-                co2_level = float(co2_match.group(1))
-                
-                return {
-                    "success": True,
-                    "co2_level": co2_level,
-                    "trend": "unknown",  # Can't determine trend from this source
-                    "date": "Recent data",
-                    "source": "CO2.Earth",
-                    "unit": "ppm"
-                }
+        source, data = co2_engine.fetch()
+        if data:
+            return data
         
         # If all fails, return a fallback with the most recent known value
         # This ensures the user always sees some data
@@ -0,0 +1,82 @@
+import threading
+
+from cache_backends import cache, MISSING
+from data_version import get_data_version
+from singleflight import SingleFlight
+from database import replica_router
+
+
+class VersionedViewCache:
+    """
+    Read-through cache for per-company view payloads, stored in the
+    application cache under the 'views' namespace.
+
+    Entries are keyed by (company, view, parameters) and stamped with the
+    company's data version when computed. Any write to the company's
+    activities or targets bumps that version, so the next read recomputes;
+    there is no TTL and nothing is ever served from before the last write.
+
+    Concurrent misses for the same entry in one process are coalesced: one
+    request computes it and the others wait for that result.
+    """
+    namespace = 'views'
+
+    def __init__(self, store=cache, enabled=True, coalesce=True):
+        self.store = store
+        self.enabled = enabled
+        self.coalesce = coalesce
+        self.flight = SingleFlight()
+
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('VIEW_CACHE_ENABLED', self.enabled)
+        self.coalesce = app.config.get('VIEW_CACHE_COALESCE', self.coalesce)
+        app.extensions['view_cache'] = self
+
+    def get_or_compute(self, company_id, view, params, compute):
+        """
+        Return the cached payload for `view` with `params` (a hashable tuple),
+        calling `compute()` on a miss. `compute` must return plain data.
+        """
+        if not self.enabled:
+            return compute()
+
+        # Read the version before computing: a write racing with compute()
+        # then only makes this entry look older than it is, never newer
+        version = get_data_version(company_id)
+        key = (company_id, view, params)
+
+        entry = self.store.get(self.namespace, key)
+        if entry is not MISSING and entry[0] == version:
+            self._count('hits')
+            return entry[1]
+
+        self._count('stale' if entry is not MISSING else 'misses')
+
+        def load():
+            # Never store a payload computed from a replica that lags `version`
+            with replica_router.consistent_with(company_id, version):
+                value = compute()
+            self.store.set(self.namespace, key, (version, value))
+            return value
+
+        if not self.coalesce:
+            return load()
+        return self.flight.do(key + (version,), load)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        return dict(stats, enabled=self.enabled,
+                    hit_rate=round(stats['hits'] / lookups, 3) if lookups else None,
+                    single_flight=self.flight.metrics() if self.coalesce else None)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+view_cache = VersionedViewCache()